@@ -8,24 +8,244 @@ Gerencia os 4 ciclos de operação e gravação de dados
 import time
 import math
 import os
+import re
 import glob
+import random
 import json
+import logging
 import serial
-import pynmea2
 import threading
+import queue
+import selectors
+import atexit
 import calendar
+import hashlib
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import pytz
-import simplekml
 import shutil
 
 try:
-    from cryptography.fernet import Fernet
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 except ImportError:  # pragma: no cover
-    Fernet = None
+    Cipher = None
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    from numba import njit
+except ImportError:  # pragma: no cover
+    njit = None
 
 from logger import adicionar_log_voo, remover_log_voo
 
+RAIO_TERRA_M = 6371000.0  # Raio médio da Terra em metros
+GRAUS_PARA_RAD = math.pi / 180.0
+METROS_POR_GRAU = RAIO_TERRA_M * GRAUS_PARA_RAD  # arco de 1° no raio médio
+# Delta de latitude (graus) a partir do qual o cos(lat) em cache é recalculado
+LIMITE_EQUIRETANGULAR_GRAUS = 0.01
+# Deslocamento estimado (velocidade × tempo) abaixo do qual o ciclo 3 não
+# calcula distância: ruído de GPS, não movimento
+DESLOCAMENTO_MINIMO_M = 0.5
+
+# $<talker><tipo>,<campos>[*<checksum>]; grupos: corpo (sem '$'), tipo, checksum
+NMEA_RE = re.compile(
+    rb'\$((?:G[PNLAB]|BD)(GGA|RMC|GSA),[^*]*)(?:\*([0-9A-Fa-f]{2}))?'
+)
+
+TIMEOUT_LEITURA_GPS = 1.1  # segundos; pouco acima do período de 1 Hz
+TAMANHO_LEITURA_GPS = 4096  # bytes por leitura da serial
+# Sentença NMEA tem no máximo 82 bytes: sobra maior que isso sem '\n' é
+# lixo (baud rate errado, ruído) e é descartada
+MAXIMO_SOBRA_GPS = 4096
+PREFIXOS_PORTAS_SERIAIS = ('ttyUSB', 'ttyACM', 'ttyS', 'ttyAMA')
+TEMPO_CACHE_PORTAS = 10.0  # segundos entre varreduras de /dev
+TEMPO_SONDAGEM_GPS = 2.0  # segundos procurando NMEA em cada porta candidata
+MAX_SONDAGENS_GPS = 4  # portas sondadas ao mesmo tempo (as demais aguardam)
+ARQUIVO_CONTADOR_DIARIO = ".counter.json"
+ARQUIVO_CONTADOR_GLOBAL = ".next_num"
+XATTR_NUMERO_GLOBAL = b"user.cotesia.num_global"  # cache do numero_global na pasta do voo
+
+KML_PONTOS_CABECALHO = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+    '<Document>\n'
+    '<Style id="ponto"><IconStyle><Icon>'
+    '<href>http://maps.google.com/mapfiles/kml/shapes/placemark_circle.png</href>'
+    '</Icon></IconStyle></Style>\n'
+)
+KML_PONTOS_RODAPE = '</Document>\n</kml>\n'
+
+# Log criptografado: CABECALHO_LOG_AESGCM || nonce (12) || tag (16) || ciphertext
+CABECALHO_LOG_AESGCM = b"CTSGCM01"
+BLOCO_CRIPTOGRAFIA_LOG = 1 << 20  # bytes cifrados por iteração
+
+SEPARADOR_TITULO = "=" * 50  # relatório DADOS
+SEPARADOR_SECAO = "-" * 30
+
+LOTE_COORDENADAS = 64  # pontos por escrita do gravador
+INTERVALO_GRAVACAO_COORDENADAS = 0.5  # segundos
+FSYNC_COORDENADAS = 16  # pontos gravados entre fsyncs
+
+_cos = math.cos
+_hypot = math.hypot
+
+def _nmea_ll(campo, hemisferio):
+    """
+    Converte latitude/longitude NMEA (ddmm.mmmm / dddmm.mmmm) para graus decimais
+    
+    Args:
+        campo: Valor do campo em bytes (ex.: b'2333.0312')
+        hemisferio: b'N', b'S', b'E' ou b'W'
+    
+    Returns:
+        float: Graus decimais (negativo para S/W) ou None se o campo estiver vazio
+    """
+    if not campo:
+        return None
+    ponto = campo.find(b'.')
+    if ponto < 0:
+        ponto = len(campo)
+    valor = int(campo[:ponto - 2] or 0) + float(campo[ponto - 2:]) / 60.0
+    return -valor if hemisferio in (b'S', b'W') else valor
+
+
+_MASCARA_64 = (1 << 64) - 1
+
+
+def _checksum_nmea(corpo):
+    """
+    Checksum NMEA (XOR de todos os bytes do corpo), 8 bytes por vez
+    
+    O corpo vira um único inteiro, dobrado em palavras de 64 bits e depois
+    em 32/16/8 bits; evita o laço byte a byte.
+    """
+    x = int.from_bytes(corpo, 'little')
+    while x > _MASCARA_64:
+        x = (x >> 64) ^ (x & _MASCARA_64)
+    x ^= x >> 32
+    x ^= x >> 16
+    x ^= x >> 8
+    return x & 0xFF
+
+
+def _parse_gga(campos):
+    """GGA: número de satélites (índice 7) e posição (índices 2-5)"""
+    num_sats = int(campos[7]) if campos[7] else None
+    posicao = None
+    lat = _nmea_ll(campos[2], campos[3])
+    lon = _nmea_ll(campos[4], campos[5])
+    if lat and lon:
+        posicao = (lat, lon)
+    return ('GGA', (num_sats, posicao))
+
+
+def _parse_rmc(campos):
+    """RMC: velocidade sobre o solo em nós (índice 7), convertida para m/s"""
+    if campos[7]:
+        return ('RMC', float(campos[7]) * 0.514444)
+    return None
+
+
+def _parse_gsa(campos):
+    """GSA: PDOP (índice 15)"""
+    if campos[15]:
+        return ('GSA', float(campos[15]))
+    return None
+
+
+# Prefixo da sentença ('$' + talker + tipo) -> parser; a consulta por
+# linha[:6] já descarta GSV/GLL/VTG/... e escolhe o parser de uma vez
+_PARSERS_NMEA = {
+    b'$' + talker + tipo: parser
+    for talker in (b'GP', b'GN', b'GL', b'GA', b'GB', b'BD')
+    for tipo, parser in ((b'GGA', _parse_gga), (b'RMC', _parse_rmc), (b'GSA', _parse_gsa))
+}
+
+
+def _serializar_metadata(dados):
+    """Serializa metadata em JSON UTF-8 indentado (orjson se disponível)"""
+    if orjson is not None:
+        return orjson.dumps(dados, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(dados, indent=2, ensure_ascii=False).encode('utf-8')
+
+
+def _desserializar_metadata(buf):
+    """Decodifica metadata JSON a partir dos bytes do arquivo (orjson se disponível)"""
+    if orjson is not None:
+        return orjson.loads(buf)
+    return json.loads(buf)
+
+
+_AUSENTE = object()  # sentinela para chaves ausentes da metadata
+
+NIVEIS_LOG = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+    'critical': logging.CRITICAL,
+}
+
+TZ_SP = pytz.timezone('America/Sao_Paulo')
+
+
+def _agora_sp():
+    """Data/hora atual no fuso de São Paulo (tzinfo em cache)"""
+    return datetime.fromtimestamp(time.time(), TZ_SP)
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    """Distância Haversine em metros entre dois pontos em graus"""
+    lat1 = lat1 * GRAUS_PARA_RAD
+    lat2 = lat2 * GRAUS_PARA_RAD
+    dlat = lat2 - lat1
+    dlon = (lon2 - lon1) * GRAUS_PARA_RAD
+    a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
+    return 2 * RAIO_TERRA_M * math.asin(math.sqrt(a))
+
+
+if njit is not None:
+    # Código nativo via Numba quando disponível (mesma fórmula)
+    _haversine = njit(cache=True, fastmath=True)(_haversine)
+
+
+def _distancia_percurso(lats, lons):
+    """
+    Calcula a distância total (Haversine) de uma sequência de coordenadas
+    
+    Args:
+        lats: Latitudes em graus (array NumPy ou lista)
+        lons: Longitudes em graus (array NumPy ou lista)
+    
+    Returns:
+        float: Distância total em metros
+    """
+    if len(lats) < 2:
+        return 0.0
+    
+    if np is not None:
+        lat = np.radians(np.asarray(lats, dtype=np.float64))
+        lon = np.radians(np.asarray(lons, dtype=np.float64))
+        dlat = np.diff(lat)
+        dlon = np.diff(lon)
+        a = np.sin(dlat / 2)**2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlon / 2)**2
+        return float(np.sum(2 * RAIO_TERRA_M * np.arcsin(np.sqrt(a))))
+    
+    total = 0.0
+    for i in range(1, len(lats)):
+        total += _haversine(lats[i - 1], lons[i - 1], lats[i], lons[i])
+    return total
+
 
 class GPSControl:
     """Controla o GPS e os ciclos de voo do sistema Cotesia"""
@@ -50,6 +270,16 @@ class GPSControl:
         self.velocidade_operacao = self.config.get('velocidade_operacao', 5.0)
         self.precisao_minima_satelites = self.config.get('precisao_minima_satelites', 3)
         self.pdop_maximo = self.config.get('pdop_maximo', 6.0)
+        self._verificar_checksum = self.config.get('verify_checksum', True)
+        self._metadata_fsync = self.config.get('metadata_fsync', False)
+        self._metadata_flush_interval = self.config.get('metadata_flush_interval', 2.0)
+        # Opcionais (desligados por padrão): núcleo fixo e prioridade SCHED_FIFO
+        # da thread de leitura; ver INSTALACAO_MANUAL.md (CAP_SYS_NICE)
+        self._cpu_leitor_gps = self.config.get('reader_cpu')  # None: sem fixar núcleo
+        self._prioridade_leitor_gps = self.config.get('reader_rt_priority', 0)  # 0: normal
+        self._leitor_elevado = False
+        self._afinidade_original = None  # restaurados nas threads de sondagem
+        self._nice_original = None
         self.first_movement_threshold = self.config.get('first_movement_threshold', 5.0)
         self.velocidade_parada = self.config.get('velocidade_parada', 1.5)
         
@@ -60,7 +290,12 @@ class GPSControl:
         self.ultima_velocidade = 0.0
         self.pdop_atual = 999.0
         self.gps_serial = None
+        self._gps_sel = None  # seletor sobre o descritor da serial
+        self._gps_fd = -1
         self.gps_port = None
+        self._rx_buf = bytearray()
+        self._portas_cache = None
+        self._portas_cache_ts = 0.0
         
         # Estado do sistema
         self.estado_sistema = "AGUARDANDO_SATELITES"
@@ -69,9 +304,11 @@ class GPSControl:
         
         # Posição e distância
         self.ultima_posicao = None
+        self._ultima_posicao_ts = 0.0
         self.distancia_acumulada = 0.0
         self.tempo_parada_atual = 0.0
         self.ultima_verificacao_parada = None
+        self._cos_lat_cache = (None, 0.0)  # (lat de referência, cos(lat))
         
         # Voo
         self.numero_voo = 0
@@ -80,23 +317,52 @@ class GPSControl:
         self.pasta_backup = os.path.join(os.path.expanduser("~"), "cotesia_backup")
         os.makedirs(self.pasta_backup, exist_ok=True)
         self.metadata_voo = {}
+        self._metadata_lock = threading.Lock()
+        self._metadata_dirty = False
+        self._metadata_versao = 0  # incrementada a cada alteração pendente
+        # Uma gravação por vez: flush periódico e flushes síncronos (fim do
+        # voo, parada, reset) compartilham o mesmo metadata.json.tmp
+        self._metadata_escrita_lock = threading.Lock()
+        self._metadata_gravada = None  # (pasta, bytes) da última gravação
+        self._metadata_flush_thread = None
         self.flight_log_handler = None
+        self._coord_q = None
+        self._coord_writer = None
+        self._limpar_coordenadas_memoria()
+        self._limpar_caminhos_voo()
+        self._max_numero_global = 0
+        self._pastas_voo_vistas = set()
+        self._proximo_numero_global = None  # em memória após a 1ª reserva
+        self._proximo_numero_diario = (None, None)  # (pasta_dia, próximo)
         self.data_voo = None
         self.data_inicio_voo_iso = None
         
-        # Estatísticas
-        self.velocidades_registradas = []
-        self.tempo_inicio_voo = None
+        # Estatísticas (média/variância da velocidade em O(1) - Welford)
+        self._vel_n = 0
+        self._vel_media = 0.0
+        self._vel_m2 = 0.0
+        self.tempo_inicio_voo = None  # time.monotonic(); data/hora exibida em data_inicio_voo
         self.tempo_fim_voo = None
         self.data_inicio_voo = None
         
-        # Thread
+        # Threads (leitura serial → fila → ciclos)
         self.thread_gps = None
+        self.thread_gps_logica = None
+        self._nmea_q = queue.Queue(maxsize=128)
+        self._stop_evt = threading.Event()
         self.rodando = False
         
+        # Máquina de estados: um handler por ciclo (indexado por ciclo_atual)
+        self._ciclo_handlers = (self._ciclo0, self._ciclo1, self._ciclo2, self._ciclo3)
+        self._ultima_atualizacao_vel = 0.0
+        self._ultimo_log_ciclo0 = 0
+        self._ultimo_pdop_log = 0
+        self._posicao_alternada = False
+        
         # Simulação
         self.modo_simulacao = False
         self.thread_simulacao = None
+        self._sim_stop = threading.Event()
         self.velocidade_media_simulacao = 12
         self._frequencia_gps_hz = self.config.get('frequency_hz', 5)
         self._frequencias_disponiveis = self.config.get('available_frequencies', list(range(1, 11)))
@@ -106,12 +372,18 @@ class GPSControl:
         
         self._log("GPSControl inicializado")
     
-    def _log(self, mensagem, level="info"):
-        """Log interno com fallback para print"""
+    def _log(self, mensagem, level="info", *args):
+        """
+        Log interno com fallback para print
+        
+        Com args a formatação ('%' do logging) só acontece se o nível
+        estiver habilitado, evitando montar a mensagem nos laços quentes.
+        """
         if self.logger:
-            getattr(self.logger, level)(mensagem)
+            if self.logger.isEnabledFor(NIVEIS_LOG.get(level, logging.INFO)):
+                getattr(self.logger, level)(mensagem, *args)
         else:
-            print(f"[GPS] {mensagem}")
+            print(f"[GPS] {mensagem % args if args else mensagem}")
     
     def iniciar(self):
         """Inicia a thread de leitura do GPS"""
@@ -120,19 +392,26 @@ class GPSControl:
             return False
         
         self.rodando = True
-        self.thread_gps = threading.Thread(target=self._thread_gps, daemon=True)
+        self._stop_evt.clear()
+        self.thread_gps = threading.Thread(target=self._thread_gps_leitor, daemon=True)
+        self.thread_gps_logica = threading.Thread(target=self._thread_gps_logica, daemon=True)
         self.thread_gps.start()
-        self._log("Thread GPS iniciada")
+        self.thread_gps_logica.start()
+        self._log("Threads GPS iniciadas (leitura e ciclos)")
         return True
     
     def parar(self):
         """Para a thread de leitura do GPS"""
         self.rodando = False
+        self._stop_evt.set()
+        self._fechar_seletor_gps()
         if self.gps_serial:
             try:
                 self.gps_serial.close()
             except:
                 pass
+        self._parar_gravador_coordenadas()
+        self._descarregar_metadata()
         self._log("Thread GPS parada")
     
     def get_status(self):
@@ -153,7 +432,7 @@ class GPSControl:
             'finalizado': self.finalizado,
             'modo_simulacao': self.modo_simulacao,
             'gps_frequency_hz': self._frequencia_gps_hz,
-            'gps_measured_frequency_hz': round(self._frequencia_mensurada_hz, 2),
+            'gps_measured_frequency_hz': round(self._frequencia_mensurada_hz, 2)
         }
     
     def get_config(self):
@@ -207,12 +486,12 @@ class GPSControl:
         self.tempo_parada_atual = 0.0
         self.ultima_verificacao_parada = None
         self.ultima_posicao = None
-        self.velocidades_registradas = []
+        self._ultima_posicao_ts = 0.0
+        self._cos_lat_cache = (None, 0.0)
+        self._resetar_estatisticas_velocidade()
         self.servo_control.contador_ativacoes = 0
-        self.tempo_inicio_voo = time.time()
-        self.data_inicio_voo = datetime.now(
-            pytz.timezone('America/Sao_Paulo')
-        ).strftime('%d/%m/%Y %H:%M:%S')
+        self.tempo_inicio_voo = time.monotonic()
+        self.data_inicio_voo = _agora_sp().strftime('%d/%m/%Y %H:%M:%S')
         self._criar_pasta_voo()
     
     def resetar_sistema(self):
@@ -226,11 +505,17 @@ class GPSControl:
         self.tempo_parada_atual = 0.0
         self.ultima_verificacao_parada = None
         self.ultima_posicao = None
-        self.velocidades_registradas = []
+        self._ultima_posicao_ts = 0.0
+        self._cos_lat_cache = (None, 0.0)
+        self._resetar_estatisticas_velocidade()
         self.tempo_inicio_voo = None
         self.tempo_fim_voo = None
         self.data_inicio_voo = None
         self.servo_control.contador_ativacoes = 0
+        self._parar_gravador_coordenadas()
+        self._descarregar_metadata()
+        self._limpar_caminhos_voo()
+        self._limpar_coordenadas_memoria()
         self.pasta_voo_atual = ""
         self.metadata_voo = {}
         self.numero_voo_diario = 0
@@ -247,94 +532,256 @@ class GPSControl:
         self._log("Sistema resetado")
         return True
     
-    def _thread_gps(self):
-        """Thread principal de leitura e processamento do GPS"""
+    def _elevar_prioridade_leitor(self):
+        """
+        Fixa a thread de leitura em um núcleo e eleva sua prioridade (Linux)
+        
+        SCHED_FIFO exige CAP_SYS_NICE (ou root); sem ela tenta nice -5 e,
+        sem permissão para isso também, segue com a prioridade normal.
+        No Linux as chamadas com pid 0 valem só para a thread atual.
+        """
+        cpu = self._cpu_leitor_gps
+        if cpu is not None and hasattr(os, 'sched_setaffinity'):
+            try:
+                afinidade = os.sched_getaffinity(0)
+                if cpu in afinidade:
+                    os.sched_setaffinity(0, {cpu})
+                    self._afinidade_original = afinidade
+                    self._leitor_elevado = True
+            except OSError as e:
+                self._log("Afinidade da leitura GPS não aplicada: %s", "debug", e)
+        
+        if not self._prioridade_leitor_gps:
+            return
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self._prioridade_leitor_gps))
+            self._leitor_elevado = True
+            self._log("Leitura GPS em SCHED_FIFO (prioridade %d)", "info", self._prioridade_leitor_gps)
+        except (AttributeError, OSError):
+            try:
+                nice_original = os.getpriority(os.PRIO_PROCESS, 0)
+                os.nice(-5)
+                self._nice_original = nice_original
+                self._leitor_elevado = True
+            except OSError as e:
+                self._log("Prioridade da leitura GPS não elevada: %s", "debug", e)
+    
+    def _prioridade_normal_sondagem(self):
+        """
+        Volta a thread atual ao escalonamento normal (threads de sondagem)
+        
+        Threads criadas pela leitura herdam núcleo, SCHED_FIFO e nice dela;
+        a sondagem das portas não precisa de nada disso.
+        """
+        if not self._leitor_elevado:
+            return
+        try:
+            if self._afinidade_original is not None:
+                os.sched_setaffinity(0, self._afinidade_original)
+            if self._nice_original is not None:
+                os.setpriority(os.PRIO_PROCESS, 0, self._nice_original)
+            elif self._prioridade_leitor_gps:
+                os.sched_setscheduler(0, os.SCHED_OTHER, os.sched_param(0))
+        except OSError as e:
+            self._log("Prioridade da sondagem não restaurada: %s", "debug", e)
+    
+    def _thread_gps_leitor(self):
+        """Thread de leitura do GPS: serial → parse NMEA → fila"""
+        self._elevar_prioridade_leitor()
         ultima_tentativa_conexao = 0
         ultima_leitura_gps = 0
         timeout_sem_dados = 15  # segundos
-        nova_posicao = None
-        ultima_atualizacao = time.time()
-        ultimo_log_ciclo0 = 0
-        ultimo_pdop_log = 0
-        posicao_alternada = False
+        leitura = memoryview(bytearray(TAMANHO_LEITURA_GPS))  # buffer de leitura reutilizado
+        parsers_nmea = _PARSERS_NMEA
         
-        while self.rodando:
+        while not self._stop_evt.is_set():
             if self.finalizado:
-                time.sleep(1)
+                self._stop_evt.wait(1.0)
                 continue
             
             try:
-                tempo_atual = time.time()
+                tempo_atual = time.monotonic()
                 
                 # Tenta conectar ao GPS se desconectado
                 if self.gps_status == "DESCONECTADO":
                     if tempo_atual - ultima_tentativa_conexao >= 2:
                         ultima_tentativa_conexao = tempo_atual
                         if self._tentar_conectar_gps():
-                            ultima_leitura_gps = time.time()
+                            ultima_leitura_gps = time.monotonic()
                     else:
-                        time.sleep(0.1)
+                        self._stop_evt.wait(0.1)
                         continue
                 
                 if self.gps_status == "DESCONECTADO":
-                    time.sleep(0.1)
+                    self._stop_evt.wait(0.1)
                     continue
                 
-                # Detecta GPS travado
-                if self.gps_serial and ultima_leitura_gps > 0:
-                    tempo_sem_dados = time.time() - ultima_leitura_gps
-                    if tempo_sem_dados > timeout_sem_dados:
-                        self._log(f"🚨 GPS TRAVADO: Sem dados há {tempo_sem_dados:.1f}s!", "error")
-                        self._desconectar_gps()
-                        continue
-                
-                # Lê dados do GPS
+                # Lê dados do GPS (leitura em bloco bloqueante até TIMEOUT_LEITURA_GPS;
+                # processa apenas sentenças completas)
                 try:
-                    if self.gps_serial and self.gps_serial.in_waiting:
-                        linha = self.gps_serial.readline().decode('ascii', errors='ignore').strip()
-                        
-                        if not linha:
+                    if self.gps_serial:
+                        sel = self._gps_sel
+                        if sel is not None:
+                            # Dorme no select() até haver bytes e lê o que
+                            # chegou direto do descritor, sem ioctl de in_waiting
+                            lidos = 0
+                            if sel.select(TIMEOUT_LEITURA_GPS):
+                                try:
+                                    lidos = os.readv(self._gps_fd, (leitura,))
+                                except OSError as e:
+                                    raise serial.SerialException(str(e))
+                                if not lidos:
+                                    raise serial.SerialException("EOF na porta serial")
+                        else:
+                            pendentes = min(self.gps_serial.in_waiting, TAMANHO_LEITURA_GPS)
+                            lidos = self.gps_serial.readinto(leitura[:pendentes or 1])
+                        if not lidos:
+                            self._verificar_gps_travado(ultima_leitura_gps, timeout_sem_dados)
                             continue
+                        rx = self._rx_buf
+                        rx += leitura[:lidos]
                         
-                        ultima_leitura_gps = time.time()
-                        if self._ultima_mensagem_ts is not None:
-                            delta = ultima_leitura_gps - self._ultima_mensagem_ts
-                            if delta > 0:
-                                instante = 1.0 / delta
-                                if self._frequencia_mensurada_hz <= 0:
-                                    self._frequencia_mensurada_hz = instante
-                                else:
-                                    self._frequencia_mensurada_hz = (
-                                        0.8 * self._frequencia_mensurada_hz + 0.2 * instante
-                                    )
-                        self._ultima_mensagem_ts = ultima_leitura_gps
-                        
-                        if linha.startswith("$GPGGA"):
-                            msg = pynmea2.parse(linha)
-                            if msg.num_sats is not None:
-                                self.num_satelites = int(msg.num_sats)
-                            if msg.latitude and msg.longitude:
-                                nova_posicao = (msg.latitude, msg.longitude)
-                                self.coordenadas_atuais = f"{msg.latitude:.6f}, {msg.longitude:.6f}"
-                        
-                        elif linha.startswith("$GPRMC"):
-                            msg = pynmea2.parse(linha)
-                            if msg.spd_over_grnd is not None:
-                                self.ultima_velocidade = msg.spd_over_grnd * 0.514444  # Nós para m/s
-                        
-                        elif linha.startswith("$GPGSA"):
-                            msg = pynmea2.parse(linha)
-                            if msg.pdop:
-                                self.pdop_atual = float(msg.pdop)
+                        # Percorre as linhas completas por índice e descarta o
+                        # trecho consumido de uma vez só no final. Travado =
+                        # nenhuma sentença válida no prazo (bytes sem '\n' ou
+                        # lixo não contam)
+                        inicio = 0
+                        sentenca_valida = False
+                        while True:
+                            fim = rx.find(b'\n', inicio)
+                            if fim < 0:
+                                break
+                            linha = bytes(rx[inicio:fim]).strip()
+                            inicio = fim + 1
+                            
+                            if not linha:
+                                continue
+                            
+                            # Descarta GSV/GLL/VTG/... sem entrar no parser
+                            parser = parsers_nmea.get(linha[:6])
+                            if parser is None:
+                                continue
+                            
+                            mensagem = self._parse_nmea(linha, parser)
+                            if mensagem is None:
+                                continue
+                            
+                            ultima_leitura_gps = time.monotonic()
+                            sentenca_valida = True
+                            
+                            # Frequência medida por fix (um GGA por época); com leitura
+                            # em bloco várias linhas chegam no mesmo instante
+                            if mensagem[0] == 'GGA':
+                                if self._ultima_mensagem_ts is not None:
+                                    delta = ultima_leitura_gps - self._ultima_mensagem_ts
+                                    if delta > 0:
+                                        instante = 1.0 / delta
+                                        if self._frequencia_mensurada_hz <= 0:
+                                            self._frequencia_mensurada_hz = instante
+                                        else:
+                                            self._frequencia_mensurada_hz = (
+                                                0.8 * self._frequencia_mensurada_hz + 0.2 * instante
+                                            )
+                                self._ultima_mensagem_ts = ultima_leitura_gps
+                            
+                            self._enfileirar_nmea(mensagem)
+                        del rx[:inicio]
+                        if len(rx) > MAXIMO_SOBRA_GPS:
+                            self._log(f"Descartando {len(rx)} bytes da serial sem fim de linha", "warning")
+                            del rx[:]
+                        if not sentenca_valida:
+                            self._verificar_gps_travado(ultima_leitura_gps, timeout_sem_dados)
                 
                 except serial.SerialException:
                     self._log("🚨 GPS DESCONECTOU durante voo!", "error")
                     self._desconectar_gps()
                     continue
                 except Exception as e:
-                    self._log(f"Erro ao ler dados: {e}", "debug")
+                    self._log("Erro ao ler dados: %s", "debug", e)
+                    # Erro repetido não pode virar laço sem pausa (a thread
+                    # pode estar em SCHED_FIFO)
+                    self._stop_evt.wait(0.1)
+                    continue
+            
+            except Exception as e:
+                self._log(f"Erro na thread de leitura do GPS: {e}", "error")
+                self._stop_evt.wait(0.1)
+    
+    def _verificar_gps_travado(self, ultima_leitura_gps, timeout_sem_dados):
+        """Desconecta o GPS se não chega sentença válida há timeout_sem_dados s"""
+        tempo_sem_dados = time.monotonic() - ultima_leitura_gps
+        if ultima_leitura_gps > 0 and tempo_sem_dados > timeout_sem_dados:
+            self._log(f"🚨 GPS TRAVADO: Sem sentença válida há {tempo_sem_dados:.1f}s!", "error")
+            self._desconectar_gps()
+    
+    def _enfileirar_nmea(self, mensagem):
+        """Enfileira mensagem NMEA; com a fila cheia descarta a mais antiga"""
+        try:
+            self._nmea_q.put_nowait(mensagem)
+        except queue.Full:
+            try:
+                self._nmea_q.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self._nmea_q.put_nowait(mensagem)
+            except queue.Full:
+                pass
+    
+    def _aplicar_nmea(self, mensagem):
+        """
+        Atualiza o estado do GPS com uma mensagem vinda da fila
+        
+        Returns:
+            tuple: Nova posição (lat, lon) se a mensagem trouxer posição, senão None
+        """
+        tipo, valores = mensagem
+        if tipo == 'GGA':
+            num_sats, posicao = valores
+            if num_sats is not None:
+                self.num_satelites = num_sats
+            if posicao is not None:
+                self.coordenadas_atuais = f"{posicao[0]:.6f}, {posicao[1]:.6f}"
+                return posicao
+        elif tipo == 'RMC':
+            self.ultima_velocidade = valores
+        elif tipo == 'GSA':
+            self.pdop_atual = valores
+        return None
+    
+    def _thread_gps_logica(self):
+        """Thread dos ciclos de voo: consome a fila NMEA e executa a máquina de estados"""
+        nova_posicao = None
+        self._ultima_atualizacao_vel = time.monotonic()
+        self._ultimo_log_ciclo0 = 0
+        self._ultimo_pdop_log = 0
+        ciclos = self._ciclo_handlers
+        fila = self._nmea_q
+        aplicar = self._aplicar_nmea
+        
+        while not self._stop_evt.is_set():
+            if self.finalizado:
+                self._stop_evt.wait(1.0)
+                continue
+            
+            try:
+                # Drena o burst inteiro (GGA+RMC+GSA da mesma época) e roda a
+                # máquina de estados uma vez com os valores finais
+                try:
+                    mensagem = fila.get(timeout=1)
+                    while True:
+                        posicao = aplicar(mensagem)
+                        if posicao is not None:
+                            nova_posicao = posicao
+                        mensagem = fila.get_nowait()
+                except queue.Empty:
+                    pass
+                
+                if self.gps_status == "DESCONECTADO":
                     continue
                 
+                tempo_atual = time.monotonic()
+                
                 # PROCESSAMENTO DOS CICLOS
                 if nova_posicao is None:
                     continue
@@ -348,184 +795,347 @@ class GPSControl:
                                self.num_satelites >= self.precisao_minima_satelites and 
                                self.pdop_atual <= self.pdop_maximo)
                 
-                # CICLO 0: Aguardando movimento inicial
-                if self.ciclo_atual == 0:
-                    if not gps_confiavel:
-                        tempo_desde_ultimo_log = tempo_atual - ultimo_log_ciclo0
-                        pdop_mudou = abs(self.pdop_atual - ultimo_pdop_log) >= 0.5
-                        
-                        if tempo_desde_ultimo_log >= 5 or pdop_mudou:
-                            self._log(f"CICLO 0: Aguardando GPS melhorar (Sats: {self.num_satelites}, PDOP: {self.pdop_atual:.1f})")
-                            ultimo_log_ciclo0 = tempo_atual
-                            ultimo_pdop_log = self.pdop_atual
-                        continue
-                    
-                    if self.ultima_velocidade >= self.first_movement_threshold:
-                        self._log(f"CICLO 0→1: Movimento iniciado ({self.ultima_velocidade:.1f} m/s)")
-                        self.ciclo_atual = 1
-                        self.estado_sistema = "OPERANDO"
-                        self.tempo_inicio_voo = time.time()
-                        tz = pytz.timezone('America/Sao_Paulo')
-                        self.data_voo = datetime.now(tz)
-                        self.data_inicio_voo = self.data_voo.strftime('%d/%m/%Y %H:%M:%S')
-                        self.data_inicio_voo_iso = self.data_voo.isoformat()
+                ciclos[self.ciclo_atual](nova_posicao, tempo_atual, gps_confiavel)
+            
+            except Exception as e:
+                self._log(f"Erro na thread de ciclos do GPS: {e}", "error")
+                time.sleep(0.1)
+    
+    def _ciclo0(self, nova_posicao, tempo_atual, gps_confiavel):
+        """CICLO 0: Aguardando movimento inicial"""
+        if not gps_confiavel:
+            tempo_desde_ultimo_log = tempo_atual - self._ultimo_log_ciclo0
+            pdop_mudou = abs(self.pdop_atual - self._ultimo_pdop_log) >= 0.5
+            
+            if tempo_desde_ultimo_log >= 5 or pdop_mudou:
+                self._log(f"CICLO 0: Aguardando GPS melhorar (Sats: {self.num_satelites}, PDOP: {self.pdop_atual:.1f})")
+                self._ultimo_log_ciclo0 = tempo_atual
+                self._ultimo_pdop_log = self.pdop_atual
+            return
+        
+        if self.ultima_velocidade >= self.first_movement_threshold:
+            self._log(f"CICLO 0→1: Movimento iniciado ({self.ultima_velocidade:.1f} m/s)")
+            self.ciclo_atual = 1
+            self.estado_sistema = "OPERANDO"
+            self.tempo_inicio_voo = time.monotonic()
+            self.data_voo = _agora_sp()
+            self.data_inicio_voo = self.data_voo.strftime('%d/%m/%Y %H:%M:%S')
+            self.data_inicio_voo_iso = self.data_voo.isoformat()
+    
+    def _ciclo1(self, nova_posicao, tempo_atual, gps_confiavel):
+        """CICLO 1: Aguardando primeira parada"""
+        if not gps_confiavel:
+            self._log(f"⚠️ CICLO 1: GPS degradado - continuando", "warning")
+        
+        if self.ultima_velocidade <= self.velocidade_parada:
+            self._log(f"CICLO 1→2: Primeira parada ({self.ultima_velocidade:.1f} m/s)")
+            
+            # Cria pasta do voo
+            self._criar_pasta_voo()
+            self._gravar_coordenada(nova_posicao)
+            
+            # Primeiro lançamento
+            self.servo_control.mover_operacao(True)
+            
+            self.ciclo_atual = 2
+            self.distancia_acumulada = 0
+            self.ultima_posicao = nova_posicao
+            self._cos_lat_cache = (nova_posicao[0], _cos(nova_posicao[0] * GRAUS_PARA_RAD))
+            self._log("CICLO 1→2: Primeira parada, primeiro lançamento realizado")
+    
+    def _ciclo2(self, nova_posicao, tempo_atual, gps_confiavel):
+        """CICLO 2: Primeira parada - aguarda retomar velocidade"""
+        if self.ultima_velocidade >= self.velocidade_operacao:
+            self._log(f"CICLO 2→3: Velocidade retomada ({self.ultima_velocidade:.1f} m/s)")
+            self.ciclo_atual = 3
+            self.distancia_acumulada = 0
+            self.ultima_posicao = nova_posicao
+            self._ultima_posicao_ts = tempo_atual
+            self.ultima_verificacao_parada = None
+            self.tempo_parada_atual = 0
+    
+    def _ciclo3(self, nova_posicao, tempo_atual, gps_confiavel):
+        """CICLO 3: Operação normal"""
+        # Lidos uma vez por fix (variáveis locais em vez de atributos)
+        velocidade = self.ultima_velocidade
+        ultima_posicao = self.ultima_posicao
+        
+        # Registra velocidades
+        if tempo_atual - self._ultima_atualizacao_vel >= 5:
+            self._registrar_velocidade(velocidade)
+            self._ultima_atualizacao_vel = tempo_atual
+        
+        # Velocidade >= threshold: em operação
+        if velocidade >= self.velocidade_operacao:
+            if self.ultima_verificacao_parada is not None:
+                self._log(f"Velocidade retomada - resetando contador ({velocidade:.1f} m/s)")
+                self.ultima_verificacao_parada = None
+                self.tempo_parada_atual = 0
+            
+            # Calcula distância percorrida. Fix repetido ou deslocamento
+            # estimado abaixo de DESLOCAMENTO_MINIMO_M pula o cálculo; a
+            # última posição é mantida, então o trecho entra no próximo delta
+            if (gps_confiavel and nova_posicao != ultima_posicao and
+                    velocidade * (tempo_atual - self._ultima_posicao_ts) >= DESLOCAMENTO_MINIMO_M):
+                distancia_delta = self._calcular_distancia_rapida(ultima_posicao, nova_posicao)
                 
-                # CICLO 1: Aguardando primeira parada
-                elif self.ciclo_atual == 1:
-                    if not gps_confiavel:
-                        self._log(f"⚠️ CICLO 1: GPS degradado - continuando", "warning")
+                if distancia_delta < 100:  # Validação: ignora saltos > 100m
+                    distancia = self.distancia_acumulada + distancia_delta
+                    self.ultima_posicao = nova_posicao
+                    self._ultima_posicao_ts = tempo_atual
                     
-                    if self.ultima_velocidade <= self.velocidade_parada:
-                        self._log(f"CICLO 1→2: Primeira parada ({self.ultima_velocidade:.1f} m/s)")
-                        
-                        # Cria pasta do voo
-                        self._criar_pasta_voo()
+                    # Verifica se atingiu distância alvo
+                    if distancia >= self.distancia_metros:
+                        self._log("Distância atingida: %.1fm >= %sm", "info",
+                                  distancia, self.distancia_metros)
                         self._gravar_coordenada(nova_posicao)
-                        
-                        # Primeiro lançamento
-                        self.servo_control.mover_operacao(True)
-                        
-                        self.ciclo_atual = 2
-                        self.distancia_acumulada = 0
-                        self.ultima_posicao = nova_posicao
-                        self._log("CICLO 1→2: Primeira parada, primeiro lançamento realizado")
-                
-                # CICLO 2: Primeira parada - aguarda retomar velocidade
-                elif self.ciclo_atual == 2:
-                    if self.ultima_velocidade >= self.velocidade_operacao:
-                        self._log(f"CICLO 2→3: Velocidade retomada ({self.ultima_velocidade:.1f} m/s)")
-                        self.ciclo_atual = 3
-                        self.distancia_acumulada = 0
-                        self.ultima_posicao = nova_posicao
-                        self.ultima_verificacao_parada = None
-                        self.tempo_parada_atual = 0
-                
-                # CICLO 3: Operação normal
-                elif self.ciclo_atual == 3:
-                    # Registra velocidades
-                    if tempo_atual - ultima_atualizacao >= 5:
-                        self.velocidades_registradas.append(self.ultima_velocidade)
-                        ultima_atualizacao = tempo_atual
-                    
-                    # Velocidade >= threshold: em operação
-                    if self.ultima_velocidade >= self.velocidade_operacao:
-                        if self.ultima_verificacao_parada is not None:
-                            self._log(f"Velocidade retomada - resetando contador ({self.ultima_velocidade:.1f} m/s)")
-                            self.ultima_verificacao_parada = None
-                            self.tempo_parada_atual = 0
-                        
-                        # Calcula distância percorrida
-                        if gps_confiavel:
-                            distancia_delta = self._calcular_distancia(self.ultima_posicao, nova_posicao)
-                            
-                            if distancia_delta < 100:  # Validação: ignora saltos > 100m
-                                self.distancia_acumulada += distancia_delta
-                                self.ultima_posicao = nova_posicao
-                                
-                                # Verifica se atingiu distância alvo
-                                if self.distancia_acumulada >= self.distancia_metros:
-                                    self._log(f"Distância atingida: {self.distancia_acumulada:.1f}m >= {self.distancia_metros}m")
-                                    self._gravar_coordenada(nova_posicao)
-                                    self.servo_control.mover_operacao(posicao_alternada)
-                                    posicao_alternada = not posicao_alternada
-                                    self.distancia_acumulada = 0
-                    
-                    # Velocidade < threshold: iniciando parada
-                    else:
-                        if self.ultima_verificacao_parada is None:
-                            self._log(f"Velocidade baixa - iniciando contador ({self.ultima_velocidade:.1f} m/s)")
-                            self.ultima_verificacao_parada = time.time()
-                        
-                        self.tempo_parada_atual = time.time() - self.ultima_verificacao_parada
-                        
-                        # Verifica se atingiu tempo de parada
-                        if self.tempo_parada_atual >= self.tempo_parada:
-                            self._log(f"CICLO 3→FIM: Parada confirmada ({self.tempo_parada_atual:.1f}s)")
-                            self._finalizar_voo()
+                        self.servo_control.mover_operacao(self._posicao_alternada)
+                        self._posicao_alternada = not self._posicao_alternada
+                        distancia = 0
+                    self.distancia_acumulada = distancia
+        
+        # Velocidade < threshold: iniciando parada
+        else:
+            if self.ultima_verificacao_parada is None:
+                self._log(f"Velocidade baixa - iniciando contador ({velocidade:.1f} m/s)")
+                self.ultima_verificacao_parada = tempo_atual
             
-            except Exception as e:
-                self._log(f"Erro na thread GPS: {e}", "error")
-                time.sleep(0.1)
+            self.tempo_parada_atual = tempo_atual - self.ultima_verificacao_parada
+            
+            # Verifica se atingiu tempo de parada
+            if self.tempo_parada_atual >= self.tempo_parada:
+                self._log(f"CICLO 3→FIM: Parada confirmada ({self.tempo_parada_atual:.1f}s)")
+                self._finalizar_voo()
+    
+    def _parse_nmea(self, linha, parser=None):
+        """
+        Interpreta as sentenças NMEA usadas pelo sistema (GGA, RMC e GSA)
+        
+        Um único regex compilado (NMEA_RE) valida o enquadramento e separa
+        tipo e checksum; os campos são lidos por índice fixo, sem pynmea2.
+        
+        Args:
+            linha: Sentença NMEA em bytes, sem terminador de linha
+            parser: Parser do tipo, se já consultado em _PARSERS_NMEA
+        
+        Returns:
+            tuple: (tipo, valores) pronto para a fila NMEA, ou None se a
+            sentença for ignorada ou inválida:
+            ('GGA', (num_sats, (lat, lon) ou None)), ('RMC', velocidade_ms),
+            ('GSA', pdop)
+        """
+        m = NMEA_RE.fullmatch(linha)
+        if m is None:
+            return None
+        
+        corpo, _tipo, checksum = m.groups()
+        if checksum is not None and self._verificar_checksum:
+            if _checksum_nmea(corpo) != int(checksum, 16):
+                return None
+        
+        if parser is None:
+            parser = _PARSERS_NMEA.get(linha[:6])
+            if parser is None:
+                return None
+        
+        try:
+            return parser(corpo.split(b','))
+        except (IndexError, ValueError):
+            self._log("Sentença NMEA inválida: %r", "debug", linha)
+            return None
+    
+    def _resetar_estatisticas_velocidade(self):
+        """Zera as estatísticas de velocidade do voo"""
+        self._vel_n = 0
+        self._vel_media = 0.0
+        self._vel_m2 = 0.0
+    
+    def _registrar_velocidade(self, velocidade):
+        """Acumula uma amostra de velocidade (algoritmo de Welford)"""
+        self._vel_n += 1
+        delta = velocidade - self._vel_media
+        self._vel_media += delta / self._vel_n
+        self._vel_m2 += delta * (velocidade - self._vel_media)
     
     def _tentar_conectar_gps(self):
-        """Tenta conectar ao GPS em todas as portas disponíveis"""
+        """
+        Tenta conectar ao GPS nas portas disponíveis
+        
+        Com mais de uma porta candidata, são sondadas em paralelo (até
+        MAX_SONDAGENS_GPS por vez) e fica a primeira (na ordem de
+        prioridade) que entregar NMEA; se nenhuma entregar, usa a
+        primeira que abrir.
+        """
         portas = self._detectar_portas_seriais()
+        if not portas:
+            return False
         
-        for porta in portas:
-            try:
-                self.gps_serial = serial.Serial(porta, 9600, timeout=1)
-                self.gps_port = porta
-                self.gps_status = "CONECTADO"
-                self._log(f"GPS CONECTADO: {porta}")
-                
-                # Limpa buffers
+        if len(portas) == 1:
+            sondagens = [self._sondar_porta(portas[0], None)]
+        else:
+            encontrou = threading.Event()
+            with ThreadPoolExecutor(max_workers=min(len(portas), MAX_SONDAGENS_GPS),
+                                    initializer=self._prioridade_normal_sondagem) as executor:
+                futuros = [executor.submit(self._sondar_porta, p, encontrou) for p in portas]
+                sondagens = [f.result() for f in futuros]
+        
+        abertas = [(p, ser, ok) for p, ser, ok in sondagens if ser is not None]
+        escolhida = next((a for a in abertas if a[2]), abertas[0] if abertas else None)
+        
+        # Fecha as portas que não serão usadas
+        for porta, ser, _ok in abertas:
+            if escolhida is None or ser is not escolhida[1]:
                 try:
-                    self.gps_serial.reset_input_buffer()
-                    self.gps_serial.reset_output_buffer()
-                    time.sleep(0.2)
-                except:
+                    ser.close()
+                except Exception:
                     pass
-                
-                return True
-            except Exception as e:
-                continue
         
-        return False
+        if escolhida is None:
+            return False
+        
+        porta, self.gps_serial, _ok = escolhida
+        self.gps_port = porta
+        self.gps_status = "CONECTADO"
+        self._log(f"GPS CONECTADO: {porta}")
+        
+        # Limpa buffers
+        try:
+            self.gps_serial.reset_input_buffer()
+            self.gps_serial.reset_output_buffer()
+            time.sleep(0.2)
+        except:
+            pass
+        
+        # Registra o descritor para a leitura por select(); sem fileno()
+        # (backend não POSIX) fica a leitura por in_waiting
+        try:
+            self._gps_fd = self.gps_serial.fileno()
+            self._gps_sel = selectors.DefaultSelector()
+            self._gps_sel.register(self._gps_fd, selectors.EVENT_READ)
+        except Exception:
+            self._fechar_seletor_gps()
+        
+        return True
+    
+    def _fechar_seletor_gps(self):
+        """Descarta o seletor da serial (a porta é fechada por quem chama)"""
+        if self._gps_sel is not None:
+            try:
+                self._gps_sel.close()
+            except Exception:
+                pass
+        self._gps_sel = None
+        self._gps_fd = -1
+    
+    def _sondar_porta(self, porta, encontrou):
+        """
+        Abre uma porta candidata e, se `encontrou` for dado, procura NMEA
+        
+        Lê por até TEMPO_SONDAGEM_GPS segundos à procura de '$G'; para
+        antes se outra porta já tiver encontrado o GPS.
+        
+        Returns:
+            tuple: (porta, serial aberta ou None, True se viu NMEA)
+        """
+        if encontrou is not None and encontrou.is_set():
+            return porta, None, False  # na fila quando outra porta já achou
+        
+        try:
+            ser = serial.Serial(porta, 9600, timeout=0.2)
+        except Exception:
+            return porta, None, False
+        
+        if encontrou is None:
+            ser.timeout = TIMEOUT_LEITURA_GPS
+            return porta, ser, False
+        
+        visto = b""
+        limite = time.monotonic() + TEMPO_SONDAGEM_GPS
+        try:
+            while time.monotonic() < limite and not encontrou.is_set():
+                visto = visto[-1:] + ser.read(256)
+                if b"$G" in visto:
+                    encontrou.set()
+                    ser.timeout = TIMEOUT_LEITURA_GPS
+                    return porta, ser, True
+            ser.timeout = TIMEOUT_LEITURA_GPS
+        except Exception:
+            try:
+                ser.close()
+            except Exception:
+                pass
+            return porta, None, False
+        return porta, ser, False
     
     def _desconectar_gps(self):
         """Desconecta do GPS"""
         self.gps_status = "DESCONECTADO"
+        self._fechar_seletor_gps()
         if self.gps_serial:
             try:
                 self.gps_serial.close()
             except:
                 pass
         self.gps_serial = None
+        self._rx_buf = bytearray()
+        self._portas_cache = None
     
     def _detectar_portas_seriais(self):
-        """Detecta portas seriais disponíveis"""
+        """Detecta portas seriais disponíveis (memoizado por TEMPO_CACHE_PORTAS)"""
+        agora = time.monotonic()
+        if self._portas_cache is not None and agora - self._portas_cache_ts < TEMPO_CACHE_PORTAS:
+            return self._portas_cache
+        
         portas = []
         
         try:
-            portas.extend(glob.glob('/dev/ttyUSB*'))
-            portas.extend(glob.glob('/dev/ttyACM*'))
-            portas.extend(glob.glob('/dev/ttyS*'))
-            portas.extend(glob.glob('/dev/ttyAMA*'))
+            # Uma única varredura de /dev, mantendo a prioridade USB > ACM > S > AMA
+            with os.scandir('/dev') as it:
+                nomes = [e.name for e in it if e.name.startswith(PREFIXOS_PORTAS_SERIAIS)]
+            for prefixo in PREFIXOS_PORTAS_SERIAIS:
+                portas.extend(f"/dev/{n}" for n in nomes if n.startswith(prefixo))
             
             if os.path.exists('/dev/serial0'):
                 portas.append('/dev/serial0')
+            
+            # /dev/serial0 é link para ttyAMA0/ttyS0: cada dispositivo é
+            # sondado uma vez só, pelo primeiro nome na ordem de prioridade
+            reais = set()
+            unicas = []
+            for porta in portas:
+                real = os.path.realpath(porta)
+                if real not in reais:
+                    reais.add(real)
+                    unicas.append(porta)
+            portas = unicas
         except Exception as e:
             self._log(f"Erro ao detectar portas: {e}", "error")
         
-        return portas or ['/dev/ttyUSB0', '/dev/ttyACM0']
+        self._portas_cache = portas or ['/dev/ttyUSB0', '/dev/ttyACM0']
+        self._portas_cache_ts = agora
+        return self._portas_cache
     
-    def _calcular_distancia(self, pos1, pos2):
-        """Calcula distância entre duas coordenadas (Haversine)"""
-        if not pos1 or not pos2:
-            return 0.0
+    def _calcular_distancia_rapida(self, pos1, pos2):
+        """
+        Distância equiretangular (plana) entre dois fixes próximos, em metros
         
-        try:
-            lat1, lon1 = pos1
-            lat2, lon2 = pos2
-            
-            lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-            
-            dlat = lat2 - lat1
-            dlon = lon2 - lon1
-            a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-            c = 2 * math.asin(math.sqrt(a))
-            r = 6371000  # Raio da Terra em metros
-            
-            return c * r
-        except Exception as e:
-            self._log(f"Erro ao calcular distância: {e}", "error")
-            return 0.0
+        Usada no ciclo 3 entre fixes consecutivos (poucos metros); saltos
+        grandes continuam sendo barrados pela validação de 100 m.
+        """
+        lat1, lon1 = pos1
+        lat2, lon2 = pos2
+        # cos(lat) quase constante entre fixes: só recalcula se a latitude
+        # se afastar mais de LIMITE_EQUIRETANGULAR_GRAUS da referência
+        lat_ref, coslat = self._cos_lat_cache
+        if lat_ref is None or abs(lat1 - lat_ref) > LIMITE_EQUIRETANGULAR_GRAUS:
+            coslat = _cos(lat1 * GRAUS_PARA_RAD)
+            self._cos_lat_cache = (lat1, coslat)
+        return METROS_POR_GRAU * _hypot(lat2 - lat1, (lon2 - lon1) * coslat)
     
     def _criar_pasta_voo(self):
         """Cria pasta para o voo atual seguindo estrutura ANO/MÊS/DIA/VOO_XX"""
         try:
-            tz = pytz.timezone('America/Sao_Paulo')
-            data_referencia = self.data_voo or datetime.now(tz)
+            data_referencia = self.data_voo or _agora_sp()
             ano = f"{data_referencia.year}"
             mes_num = data_referencia.month
             mes_nome = calendar.month_name[mes_num].upper()
@@ -533,18 +1143,10 @@ class GPSControl:
 
             pasta_dia = os.path.join(self.pasta_backup, ano, mes_nome, dia)
             os.makedirs(pasta_dia, exist_ok=True)
+            self._descarregar_metadata()  # pendências do voo anterior
 
             # Número sequencial do dia
-            existentes = glob.glob(os.path.join(pasta_dia, "VOO_*"))
-            if existentes:
-                numeros_diarios = [
-                    int(os.path.basename(p).split('_')[-1])
-                    for p in existentes
-                    if os.path.basename(p).split('_')[-1].isdigit()
-                ]
-                self.numero_voo_diario = max(numeros_diarios) + 1 if numeros_diarios else 1
-            else:
-                self.numero_voo_diario = 1
+            self.numero_voo_diario = self._obter_proximo_numero_diario(pasta_dia)
 
             # Número global sequencial
             self.numero_voo = self._obter_proximo_numero_global()
@@ -552,6 +1154,7 @@ class GPSControl:
             pasta_voo_nome = f"VOO_{self.numero_voo_diario:02d}"
             self.pasta_voo_atual = os.path.join(pasta_dia, pasta_voo_nome)
             os.makedirs(self.pasta_voo_atual, exist_ok=True)
+            self._gravar_xattr_numero_global(self.pasta_voo_atual, self.numero_voo)
 
             data_iso = data_referencia.isoformat()
             data_humana = data_referencia.strftime('%d/%m/%Y %H:%M:%S')
@@ -576,7 +1179,10 @@ class GPSControl:
                 },
                 "log_encrypted": False,
             }
+            self._definir_caminhos_voo()
             self._salvar_metadata_voo()
+            self._limpar_coordenadas_memoria()
+            self._iniciar_gravador_coordenadas()
 
             if self.logger:
                 self.flight_log_handler = adicionar_log_voo(
@@ -592,25 +1198,161 @@ class GPSControl:
             self._log(f"Erro ao criar pasta do voo: {e}", "error")
             return False
     
+    def _definir_caminhos_voo(self):
+        """Resolve uma única vez os caminhos dos arquivos do voo atual"""
+        arquivos = self.metadata_voo.get('arquivos', {})
+        n = self.numero_voo_diario
+        pasta = self.pasta_voo_atual
+        self._coord_path = os.path.join(pasta, arquivos.get('coordenadas', f"VOO{n:02d}.txt"))
+        self._percurso_path = os.path.join(pasta, arquivos.get('percurso', f"PERCURSO{n:02d}.kml"))
+        self._pontos_path = os.path.join(pasta, arquivos.get('pontos', f"PONTOS{n:02d}.kml"))
+        self._relatorio_path = os.path.join(pasta, arquivos.get('relatorio', f"DADOS{n:02d}.txt"))
+        log_nome = arquivos.get('log')
+        self._log_path = os.path.join(pasta, log_nome) if log_nome else None
+    
+    def _limpar_caminhos_voo(self):
+        """Esquece os caminhos do voo (sem voo ativo)"""
+        self._coord_path = None
+        self._percurso_path = None
+        self._pontos_path = None
+        self._relatorio_path = None
+        self._log_path = None
+    
+    def _iniciar_gravador_coordenadas(self):
+        """Inicia o gravador de coordenadas (thread + fila) do voo atual"""
+        self._parar_gravador_coordenadas()
+        if self._coord_path is None:
+            self._definir_caminhos_voo()
+        self._coord_q = queue.Queue()
+        self._coord_writer = threading.Thread(
+            target=self._thread_gravador_coordenadas,
+            args=(self._coord_path, self._coord_q),
+            daemon=True
+        )
+        self._coord_writer.start()
+    
+    def _parar_gravador_coordenadas(self):
+        """Encerra o gravador de coordenadas, aguardando flush + fsync"""
+        writer, fila = self._coord_writer, self._coord_q
+        self._coord_writer = None
+        self._coord_q = None
+        if writer is None:
+            return
+        fila.put(None)
+        writer.join(timeout=5)
+        if writer.is_alive():
+            self._log("Gravador de coordenadas não finalizou a tempo", "warning")
+    
+    def _thread_gravador_coordenadas(self, arquivo, fila):
+        """
+        Thread que grava coordenadas em lote
+        
+        Agrupa até LOTE_COORDENADAS pontos ou INTERVALO_GRAVACAO_COORDENADAS
+        segundos por escrita; faz fsync a cada FSYNC_COORDENADAS pontos
+        gravados e, ao receber None, descarrega, faz fsync e fecha.
+        """
+        fh = None
+        encerrar = False
+        sem_fsync = 0
+        while not encerrar:
+            item = fila.get()
+            lote = []
+            if item is None:
+                encerrar = True
+            else:
+                lote.append(item)
+                limite = time.monotonic() + INTERVALO_GRAVACAO_COORDENADAS
+                while len(lote) < LOTE_COORDENADAS:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        break
+                    try:
+                        item = fila.get(timeout=restante)
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        encerrar = True
+                        break
+                    lote.append(item)
+            
+            try:
+                if fh is None:
+                    fh = open(arquivo, "a", buffering=8192)
+                if lote:
+                    fh.writelines([f"{lat:.6f}, {lon:.6f}\n" for lat, lon in lote])
+                    fh.flush()
+                    sem_fsync += len(lote)
+                if encerrar or sem_fsync >= FSYNC_COORDENADAS:
+                    os.fsync(fh.fileno())
+                    sem_fsync = 0
+            except Exception as e:
+                self._log(f"Erro ao gravar coordenadas: {e}", "error")
+                # Descarta o handle para reabrir o arquivo no próximo lote
+                if fh is not None:
+                    try:
+                        fh.close()
+                    except Exception:
+                        pass
+                    fh = None
+        
+        if fh is not None:
+            try:
+                fh.close()
+            except Exception:
+                pass
+    
+    def _limpar_coordenadas_memoria(self):
+        """Zera as coordenadas do voo mantidas em memória (lats e lons separados)"""
+        if np is not None:
+            self._lats = np.empty(256, dtype=np.float64)
+            self._lons = np.empty(256, dtype=np.float64)
+        else:
+            self._lats = []
+            self._lons = []
+        self._n_coords = 0
+    
+    def _guardar_coordenada_memoria(self, lat, lon):
+        """Acrescenta uma coordenada em memória (capacidade dobra quando cheia)"""
+        n = self._n_coords
+        if np is not None:
+            if n == self._lats.shape[0]:
+                lats = np.empty(2 * n, dtype=np.float64)
+                lons = np.empty(2 * n, dtype=np.float64)
+                lats[:n] = self._lats
+                lons[:n] = self._lons
+                self._lats, self._lons = lats, lons
+            self._lats[n] = lat
+            self._lons[n] = lon
+        else:
+            self._lats.append(lat)
+            self._lons.append(lon)
+        self._n_coords = n + 1
+    
+    def _coordenadas_memoria(self):
+        """
+        Coordenadas do voo em memória, com a mesma precisão do arquivo
+        
+        Returns:
+            tuple: Listas (lats, lons) em graus, arredondadas a 6 casas
+        """
+        n = self._n_coords
+        if np is not None:
+            return np.round(self._lats[:n], 6).tolist(), np.round(self._lons[:n], 6).tolist()
+        return [round(v, 6) for v in self._lats], [round(v, 6) for v in self._lons]
+    
     def _gravar_coordenada(self, posicao):
-        """Grava coordenada no arquivo do voo"""
+        """Enfileira coordenada para o gravador do voo (não bloqueia o GPS)"""
         if not self.pasta_voo_atual:
             return
         
         try:
-            coordenadas_nome = self.metadata_voo.get('arquivos', {}).get(
-                'coordenadas',
-                f"VOO{self.numero_voo_diario:02d}.txt"
-            )
-            arquivo = os.path.join(self.pasta_voo_atual, coordenadas_nome)
+            if self._coord_q is None:
+                self._iniciar_gravador_coordenadas()
             lat, lon = posicao
+            self._coord_q.put((lat, lon))
+            self._guardar_coordenada_memoria(lat, lon)
             
-            with open(arquivo, "a") as f:
-                f.write(f"{lat:.6f}, {lon:.6f}\n")
-                f.flush()
-                os.fsync(f.fileno())
-            
-            self._log(f"Coordenada gravada: {lat:.6f}, {lon:.6f}", "debug")
+            self._log("Coordenada gravada: %.6f, %.6f", "debug", lat, lon)
         except Exception as e:
             self._log(f"Erro ao gravar coordenada: {e}", "error")
     
@@ -618,11 +1360,14 @@ class GPSControl:
         """Finaliza o voo e gera relatórios"""
         self.finalizado = True
         self.estado_sistema = "CONVERTENDO"
-        self.tempo_fim_voo = time.time()
+        self.tempo_fim_voo = time.monotonic()
         
         # Reset servos
         self.servo_control.reset()
         
+        # Garante coordenadas em disco antes de gerar os arquivos
+        self._parar_gravador_coordenadas()
+        
         # Gera arquivos
         self._gerar_kml()
         self._gerar_relatorio()
@@ -634,9 +1379,8 @@ class GPSControl:
             if os.path.isfile(caminho):
                 tamanho_total += os.path.getsize(caminho)
         
-        tz = pytz.timezone('America/Sao_Paulo')
         self._salvar_metadata_voo({
-            "finalizado_em": datetime.now(tz).isoformat(),
+            "finalizado_em": _agora_sp().isoformat(),
             "modo_simulacao": self.modo_simulacao,
             "tamanho_mb": round(tamanho_total / 1024 / 1024, 2)
         })
@@ -645,12 +1389,12 @@ class GPSControl:
             remover_log_voo(self.logger, self.flight_log_handler)
             self.flight_log_handler = None
         
-        log_nome = self.metadata_voo.get('arquivos', {}).get('log')
-        if log_nome:
-            caminho_log = os.path.join(self.pasta_voo_atual, log_nome)
-            self._tentar_criptografar_log(caminho_log)
+        if self._log_path:
+            self._tentar_criptografar_log(self._log_path)
         
+        self._descarregar_metadata()
         self.modo_simulacao = False
+        self._sim_stop.set()  # parada manual durante simulação encerra a thread
         
         self.estado_sistema = "FINALIZADO"
         self._log("✅ Voo finalizado com sucesso")
@@ -661,168 +1405,445 @@ class GPSControl:
             return
         
         try:
-            coordenadas_nome = self.metadata_voo.get('arquivos', {}).get(
-                'coordenadas',
-                f"VOO{self.numero_voo_diario:02d}.txt"
-            )
-            arquivo_txt = os.path.join(self.pasta_voo_atual, coordenadas_nome)
+            arquivo_txt = self._coord_path
             
-            if not os.path.exists(arquivo_txt):
+            if not arquivo_txt or not os.path.exists(arquivo_txt):
                 self._log("Arquivo de coordenadas não encontrado", "warning")
                 return
             
-            # Lê coordenadas
-            coordenadas = []
-            with open(arquivo_txt, 'r') as f:
-                for linha in f:
-                    try:
-                        lat, lon = map(float, linha.strip().split(','))
-                        coordenadas.append((lon, lat))  # KML usa (lon, lat)
-                    except:
-                        continue
+            # Coordenadas (lat, lon): da memória do voo; do arquivo só se vazia
+            if self._n_coords:
+                lats, lons = self._coordenadas_memoria()
+            else:
+                lats, lons = self._ler_coordenadas(arquivo_txt)
             
-            if not coordenadas:
+            if not lats:
                 self._log("Nenhuma coordenada válida encontrada", "warning")
                 return
             
+            coordenadas = list(zip(lons, lats))  # KML usa (lon, lat)
+            
+            self._salvar_metadata_voo({
+                "distancia_percurso_m": round(_distancia_percurso(lats, lons), 2)
+            })
+            
+            # simplekml (e a pilha XML que ele traz) só é carregado aqui, uma
+            # vez por voo, e não na inicialização do serviço
+            import simplekml
+            
             # KML do percurso
             kml_percurso = simplekml.Kml()
             ls = kml_percurso.newlinestring(name=f"Percurso Voo {self.numero_voo}")
             ls.coords = coordenadas
             ls.style.linestyle.width = 3
             ls.style.linestyle.color = simplekml.Color.red
-            percurso_nome = self.metadata_voo.get('arquivos', {}).get(
-                'percurso',
-                f"PERCURSO{self.numero_voo_diario:02d}.kml"
-            )
-            arquivo_percurso = os.path.join(self.pasta_voo_atual, percurso_nome)
-            kml_percurso.save(arquivo_percurso)
-            
-            # KML dos pontos
-            kml_pontos = simplekml.Kml()
-            for coord in coordenadas:
-                pnt = kml_pontos.newpoint(name="")
-                pnt.coords = [coord]
-                pnt.style.iconstyle.icon.href = 'http://maps.google.com/mapfiles/kml/shapes/placemark_circle.png'
-            pontos_nome = self.metadata_voo.get('arquivos', {}).get(
-                'pontos',
-                f"PONTOS{self.numero_voo_diario:02d}.kml"
+            kml_percurso.save(self._percurso_path)
+            
+            # KML dos pontos (montado direto em texto: um Placemark por ponto
+            # compartilhando um único estilo, sem o grafo de objetos do simplekml)
+            partes = [KML_PONTOS_CABECALHO]
+            partes.extend(
+                f"<Placemark><name></name><styleUrl>#ponto</styleUrl>"
+                f"<Point><coordinates>{lon},{lat},0.0</coordinates></Point></Placemark>\n"
+                for lon, lat in coordenadas
             )
-            arquivo_pontos = os.path.join(self.pasta_voo_atual, pontos_nome)
-            kml_pontos.save(arquivo_pontos)
+            partes.append(KML_PONTOS_RODAPE)
+            with open(self._pontos_path, 'w', encoding='utf-8') as f:
+                f.write(''.join(partes))
             
             self._log(f"Arquivos KML gerados com {len(coordenadas)} pontos")
         except Exception as e:
             self._log(f"Erro ao gerar KML: {e}", "error")
     
+    def _ler_coordenadas(self, arquivo_txt):
+        """
+        Lê o arquivo de coordenadas do voo
+        
+        Returns:
+            tuple: Listas (lats, lons) em graus
+        """
+        if np is not None:
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")  # arquivo vazio
+                    dados = np.loadtxt(arquivo_txt, delimiter=',', dtype=np.float64, ndmin=2)
+                if dados.size:
+                    return dados[:, 0].tolist(), dados[:, 1].tolist()
+                return [], []
+            except ValueError:
+                pass  # Linha malformada: usa leitura tolerante abaixo
+        
+        lats, lons = [], []
+        with open(arquivo_txt, 'r') as f:
+            for linha in f:
+                try:
+                    lat, lon = map(float, linha.strip().split(','))
+                    lats.append(lat)
+                    lons.append(lon)
+                except:
+                    continue
+        return lats, lons
+    
     def _gerar_relatorio(self):
         """Gera relatório do voo"""
         if not self.pasta_voo_atual:
             return
         
         try:
-            relatorio_nome = self.metadata_voo.get('arquivos', {}).get(
-                'relatorio',
-                f"DADOS{self.numero_voo_diario:02d}.txt"
-            )
-            arquivo = os.path.join(self.pasta_voo_atual, relatorio_nome)
+            arquivo = self._relatorio_path
             
             duracao = 0
             if self.tempo_fim_voo and self.tempo_inicio_voo:
                 duracao = self.tempo_fim_voo - self.tempo_inicio_voo
             
-            vel_media = 0
-            if self.velocidades_registradas:
-                vel_media = sum(self.velocidades_registradas) / len(self.velocidades_registradas)
+            vel_media = self._vel_media if self._vel_n else 0
+            vel_desvio = math.sqrt(self._vel_m2 / (self._vel_n - 1)) if self._vel_n > 1 else 0
             
+            tubos = self.servo_control.contador_ativacoes
+            relatorio = (
+                f"{SEPARADOR_TITULO}\n"
+                f"  RELATÓRIO DE VOO - VOO_{self.numero_voo}\n"
+                f"{SEPARADOR_TITULO}\n\n"
+                f"Data: {_agora_sp().strftime('%d/%m/%Y %H:%M:%S')}\n"
+                f"Início do voo: {self.data_inicio_voo or 'N/A'}\n\n"
+                "INFORMAÇÕES OPERACIONAIS:\n"
+                f"{SEPARADOR_SECAO}\n"
+                f"Distância entre tubos: {self.distancia_metros}m\n"
+                f"Tubos lançados: {tubos}\n"
+                f"Duração: {int(duracao//60)}min {int(duracao%60)}s\n\n"
+                "DADOS DE DESEMPENHO:\n"
+                f"{SEPARADOR_SECAO}\n"
+                f"Velocidade média: {vel_media * 3.6:.1f} km/h\n"
+                f"Desvio padrão da velocidade: {vel_desvio * 3.6:.1f} km/h\n"
+                f"Distância percorrida: {tubos * self.distancia_metros}m\n\n"
+                "QUALIDADE DOS DADOS:\n"
+                f"{SEPARADOR_SECAO}\n"
+                f"Satélites: {self.num_satelites}\n"
+                f"PDOP médio: {self.pdop_atual:.2f}\n"
+            )
             with open(arquivo, 'w', encoding='utf-8') as f:
-                f.write("="*50 + "\n")
-                f.write(f"  RELATÓRIO DE VOO - VOO_{self.numero_voo}\n")
-                f.write("="*50 + "\n\n")
-                f.write(f"Data: {datetime.now(pytz.timezone('America/Sao_Paulo')).strftime('%d/%m/%Y %H:%M:%S')}\n")
-                f.write(f"Início do voo: {self.data_inicio_voo or 'N/A'}\n\n")
-                f.write("INFORMAÇÕES OPERACIONAIS:\n")
-                f.write("-"*30 + "\n")
-                f.write(f"Distância entre tubos: {self.distancia_metros}m\n")
-                f.write(f"Tubos lançados: {self.servo_control.contador_ativacoes}\n")
-                f.write(f"Duração: {int(duracao//60)}min {int(duracao%60)}s\n\n")
-                f.write("DADOS DE DESEMPENHO:\n")
-                f.write("-"*30 + "\n")
-                f.write(f"Velocidade média: {vel_media * 3.6:.1f} km/h\n")
-                f.write(f"Distância percorrida: {self.servo_control.contador_ativacoes * self.distancia_metros}m\n\n")
-                f.write("QUALIDADE DOS DADOS:\n")
-                f.write("-"*30 + "\n")
-                f.write(f"Satélites: {self.num_satelites}\n")
-                f.write(f"PDOP médio: {self.pdop_atual:.2f}\n")
+                f.write(relatorio)
             
             self._log(f"Relatório gerado: {arquivo}")
             
             minutos = int(duracao // 60)
             segundos = int(duracao % 60)
             self._salvar_metadata_voo({
-                "tubos": self.servo_control.contador_ativacoes,
+                "tubos": tubos,
                 "duracao_segundos": duracao,
                 "duracao_humana": f"{minutos}min {segundos}s",
                 "velocidade_media_kmh": round(vel_media * 3.6, 2),
-                "distancia_total_m": self.servo_control.contador_ativacoes * self.distancia_metros
+                "velocidade_desvio_kmh": round(vel_desvio * 3.6, 2),
+                "distancia_total_m": tubos * self.distancia_metros
             })
         except Exception as e:
             self._log(f"Erro ao gerar relatório: {e}", "error")
     
+    def _obter_proximo_numero_diario(self, pasta_dia):
+        """
+        Reserva o próximo número sequencial de voo do dia
+        
+        Mantém o próximo número do dia em memória; sem ele usa o contador
+        persistido em pasta_dia/.counter.json, e só varre as pastas VOO_*
+        quando o contador não existe ou está inconsistente.
+        """
+        contador_path = os.path.join(pasta_dia, ARQUIVO_CONTADOR_DIARIO)
+        numero = None
+        dia_cache, proximo_cache = self._proximo_numero_diario
+        if dia_cache == pasta_dia:
+            numero = proximo_cache
+        else:
+            try:
+                with open(contador_path, 'r', encoding='utf-8') as f:
+                    numero = int(json.load(f)['next'])
+            except (OSError, ValueError, KeyError, TypeError):
+                numero = None
+        if numero is not None and (numero < 1 or os.path.exists(os.path.join(pasta_dia, f"VOO_{numero:02d}"))):
+            numero = None
+        
+        if numero is None:
+            existentes = glob.glob(os.path.join(pasta_dia, "VOO_*"))
+            numeros_diarios = [
+                int(os.path.basename(p).split('_')[-1])
+                for p in existentes
+                if os.path.basename(p).split('_')[-1].isdigit()
+            ]
+            numero = max(numeros_diarios) + 1 if numeros_diarios else 1
+        
+        self._proximo_numero_diario = (pasta_dia, numero + 1)
+        try:
+            tmp_path = f"{contador_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"next": numero + 1}, f)
+            os.replace(tmp_path, contador_path)
+        except Exception as e:
+            self._log(f"Erro ao salvar contador diário: {e}", "warning")
+        
+        return numero
+    
     def _obter_proximo_numero_global(self):
-        """Descobre o próximo identificador global de voo"""
+        """
+        Reserva o próximo identificador global de voo
+        
+        Depois da primeira reserva o próximo número fica em memória. Na
+        primeira, lê pasta_backup/.next_num (uint32 little-endian); só varre
+        o histórico quando o contador não existe ou está corrompido, e nesse
+        caso o contador é recriado. O arquivo é sempre atualizado.
+        """
+        numero = self._proximo_numero_global
+        if numero is None:
+            try:
+                numero = self._ler_contador_global()
+            except FileNotFoundError:
+                numero = self._varrer_numero_global()
+            except (OSError, ValueError) as e:
+                self._log(f"Contador global inválido ({e}); varrendo histórico", "warning")
+                numero = self._varrer_numero_global()
+        
+        self._proximo_numero_global = numero + 1
         try:
-            meta_files = glob.glob(
-                os.path.join(self.pasta_backup, "**", "metadata.json"),
-                recursive=True
-            )
-            numeros = []
-            for meta_file in meta_files:
-                try:
-                    with open(meta_file, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    valor = int(data.get('numero_global') or data.get('numero') or 0)
-                    if valor:
-                        numeros.append(valor)
-                except Exception:
+            self._gravar_contador_global(numero + 1)
+        except Exception as e:
+            self._log(f"Erro ao salvar contador global: {e}", "warning")
+        
+        return numero
+    
+    def _ler_contador_global(self):
+        """Lê o próximo número global do arquivo contador (4 bytes)"""
+        fd = os.open(os.path.join(self.pasta_backup, ARQUIVO_CONTADOR_GLOBAL), os.O_RDONLY)
+        try:
+            dados = os.read(fd, 5)
+        finally:
+            os.close(fd)
+        if len(dados) != 4:
+            raise ValueError(f"tamanho {len(dados)}")
+        numero = int.from_bytes(dados, 'little')
+        if numero < 1:
+            raise ValueError(numero)
+        return numero
+    
+    def _gravar_contador_global(self, numero):
+        """Grava atomicamente o próximo número global (tmp + os.replace)"""
+        contador_path = os.path.join(self.pasta_backup, ARQUIVO_CONTADOR_GLOBAL)
+        tmp_path = f"{contador_path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, numero.to_bytes(4, 'little'))
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, contador_path)
+    
+    def _varrer_numero_global(self):
+        """
+        Descobre o próximo identificador global varrendo o histórico de voos
+        
+        Percorre pasta_backup numa única passada (ANO/MÊS/DIA/VOO_XX e pastas
+        VOO_X antigas na raiz). O maior número visto e as pastas já lidas
+        ficam em cache, então varreduras seguintes só olham as pastas novas;
+        o número vem do xattr XATTR_NUMERO_GLOBAL e só sem ele o
+        metadata.json é decodificado.
+        """
+        try:
+            pendentes = []
+            for pasta_voo, legado in self._listar_pastas_voo():
+                if pasta_voo in self._pastas_voo_vistas:
                     continue
-            
-            # Compatibilidade com estrutura antiga (VOO_X na raiz)
-            pastas_antigas = glob.glob(os.path.join(self.pasta_backup, "VOO_*"))
-            for pasta in pastas_antigas:
-                try:
-                    valor = int(os.path.basename(pasta).split('_')[-1])
-                    numeros.append(valor)
-                except Exception:
+                if not legado:
+                    pendentes.append(pasta_voo)
                     continue
+                # Compatibilidade com estrutura antiga (VOO_X na raiz)
+                sufixo = os.path.basename(pasta_voo).split('_')[-1]
+                self._pastas_voo_vistas.add(pasta_voo)
+                if sufixo.isdigit() and int(sufixo) > self._max_numero_global:
+                    self._max_numero_global = int(sufixo)
+            
+            # Leitura de metadata é I/O: sobrepõe as leituras num pool de threads
+            if len(pendentes) > 1:
+                with ThreadPoolExecutor(max_workers=min(8, len(pendentes))) as executor:
+                    valores = list(executor.map(self._ler_numero_global_pasta, pendentes))
+            else:
+                valores = [self._ler_numero_global_pasta(p) for p in pendentes]
+            
+            for pasta_voo, valor in zip(pendentes, valores):
+                if valor is None:
+                    continue  # Metadata ilegível: tenta de novo na próxima varredura
+                self._pastas_voo_vistas.add(pasta_voo)
+                if valor > self._max_numero_global:
+                    self._max_numero_global = valor
             
-            return max(numeros) + 1 if numeros else 1
+            return self._max_numero_global + 1
         except Exception as e:
             self._log(f"Erro ao calcular número global: {e}", "warning")
-            return 1
+            return self._max_numero_global + 1
+    
+    def _ler_numero_global_pasta(self, pasta_voo):
+        """
+        Número global de uma pasta de voo (xattr ou metadata.json)
+        
+        Returns:
+            int: Número (0 se não houver metadata), ou None se ilegível
+        """
+        valor = self._ler_xattr_numero_global(pasta_voo)
+        if valor is not None:
+            return valor
+        try:
+            with open(os.path.join(pasta_voo, "metadata.json"), 'rb') as f:
+                data = _desserializar_metadata(f.read())
+            valor = int(data.get('numero_global') or data.get('numero') or 0)
+        except FileNotFoundError:
+            return 0
+        except Exception:
+            return None
+        if valor:
+            self._gravar_xattr_numero_global(pasta_voo, valor)
+        return valor
+    
+    @staticmethod
+    def _ler_xattr_numero_global(pasta_voo):
+        """Lê o numero_global em cache no xattr da pasta (None se ausente)"""
+        try:
+            return int(os.getxattr(pasta_voo, XATTR_NUMERO_GLOBAL))
+        except (AttributeError, OSError, ValueError):
+            return None
+    
+    @staticmethod
+    def _gravar_xattr_numero_global(pasta_voo, numero):
+        """Guarda o numero_global no xattr da pasta (ignorado sem suporte a xattr)"""
+        try:
+            os.setxattr(pasta_voo, XATTR_NUMERO_GLOBAL, str(numero).encode())
+        except (AttributeError, OSError):
+            pass
+    
+    def _listar_pastas_voo(self):
+        """
+        Gera (caminho, legado) de cada pasta de voo em pasta_backup
+        
+        Uma única passada com os.scandir e pilha explícita (is_dir/name vêm
+        do dirent, sem stat extra): na raiz as pastas VOO_X são legado
+        (número no nome); abaixo dela, toda pasta com metadata.json é um voo
+        e não é descida. Pastas ocultas (.git etc.) são ignoradas.
+        """
+        raiz = self.pasta_backup
+        pilha = [raiz]
+        while pilha:
+            pasta = pilha.pop()
+            subpastas = []
+            legados = []
+            tem_metadata = False
+            try:
+                with os.scandir(pasta) as it:
+                    for entry in it:
+                        nome = entry.name
+                        if entry.is_dir(follow_symlinks=False):
+                            if nome.startswith("."):
+                                continue
+                            if pasta is raiz and nome.startswith("VOO_"):
+                                legados.append(entry.path)
+                            else:
+                                subpastas.append(entry.path)
+                        elif nome == "metadata.json":
+                            tem_metadata = True
+            except OSError:
+                continue
+            
+            for legado in legados:
+                yield legado, True
+            if tem_metadata and pasta is not raiz:
+                yield pasta, False
+            else:
+                pilha.extend(subpastas)
     
     def _salvar_metadata_voo(self, extra=None):
-        """Atualiza arquivo de metadata do voo atual"""
+        """
+        Atualiza a metadata do voo atual
+        
+        Só mescla em memória e marca como pendente; a thread de flush grava
+        no máximo a cada metadata_flush_interval segundos (e o fim do voo,
+        reset, parada e saída do processo forçam a gravação).
+        """
         if not self.pasta_voo_atual:
             return
         
-        try:
+        with self._metadata_lock:
             if self.metadata_voo is None:
                 self.metadata_voo = {}
             if extra:
-                self.metadata_voo.update(extra)
+                atual = self.metadata_voo
+                if all(atual.get(k, _AUSENTE) == v for k, v in extra.items()):
+                    return  # Sem mudança: não reserializa nem regrava
+                atual.update(extra)
+            self._metadata_dirty = True
+            self._metadata_versao += 1
             
-            meta_path = os.path.join(self.pasta_voo_atual, "metadata.json")
-            with open(meta_path, 'w', encoding='utf-8') as f:
-                json.dump(self.metadata_voo, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            self._log(f"Erro ao salvar metadata do voo: {e}", "error")
+            iniciar_flush = self._metadata_flush_thread is None
+            if iniciar_flush:
+                self._metadata_flush_thread = threading.Thread(
+                    target=self._thread_flush_metadata,
+                    daemon=True
+                )
+        
+        if iniciar_flush:
+            self._metadata_flush_thread.start()
+            atexit.register(self._descarregar_metadata)
+    
+    def _thread_flush_metadata(self):
+        """Thread que grava a metadata pendente periodicamente"""
+        while True:
+            time.sleep(self._metadata_flush_interval)
+            self._descarregar_metadata()
+    
+    def _descarregar_metadata(self):
+        """
+        Grava metadata.json agora se houver alterações pendentes
+        
+        Serialização, escrita do .tmp e os.replace acontecem sob
+        _metadata_escrita_lock; a pendência só é limpa depois do replace e
+        se nada mudou nesse meio tempo.
+        """
+        with self._metadata_escrita_lock:
+            with self._metadata_lock:
+                if not self._metadata_dirty or not self.pasta_voo_atual:
+                    return
+                try:
+                    buf = _serializar_metadata(self.metadata_voo)
+                except Exception as e:
+                    self._log(f"Erro ao salvar metadata do voo: {e}", "error")
+                    return
+                pasta = self.pasta_voo_atual
+                versao = self._metadata_versao
+            
+            if self._metadata_gravada != (pasta, buf):
+                try:
+                    meta_path = os.path.join(pasta, "metadata.json")
+                    tmp_path = f"{meta_path}.tmp"
+                    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                    try:
+                        os.write(fd, buf)
+                        if self._metadata_fsync:
+                            os.fsync(fd)
+                    finally:
+                        os.close(fd)
+                    os.replace(tmp_path, meta_path)
+                except Exception as e:
+                    # Continua pendente: tenta de novo no próximo flush
+                    self._log(f"Erro ao salvar metadata do voo: {e}", "error")
+                    return
+                self._metadata_gravada = (pasta, buf)
+            
+            with self._metadata_lock:
+                if self._metadata_versao == versao:
+                    self._metadata_dirty = False
     
     def _tentar_criptografar_log(self, arquivo_log):
-        """Aplica criptografia ao log se houver chave configurada"""
+        """
+        Aplica criptografia ao log se houver chave configurada
+        
+        AES-256-GCM em streaming (chave = SHA-256 do arquivo de chave); o tag
+        é gravado no cabeçalho ao final, sobre o espaço reservado.
+        """
         if not os.path.exists(arquivo_log):
             return
-        if Fernet is None:
+        if Cipher is None:
             self._log("Biblioteca 'cryptography' não instalada; log não foi criptografado", "warning")
             return
         
@@ -833,25 +1854,38 @@ class GPSControl:
         
         try:
             with open(chave_path, 'rb') as key_file:
-                chave = key_file.read().strip()
-            fernet = Fernet(chave)
+                chave = hashlib.sha256(key_file.read().strip()).digest()
         except Exception as e:
             self._log(f"Erro ao carregar chave de criptografia: {e}", "error")
             return
         
         try:
-            with open(arquivo_log, 'rb') as f:
-                conteudo = f.read()
-            criptografado = fernet.encrypt(conteudo)
+            nonce = os.urandom(12)
+            encryptor = Cipher(algorithms.AES(chave), modes.GCM(nonce)).encryptor()
+            entrada = bytearray(BLOCO_CRIPTOGRAFIA_LOG)
+            saida = bytearray(BLOCO_CRIPTOGRAFIA_LOG + 15)
+            v_entrada, v_saida = memoryview(entrada), memoryview(saida)
+            
             arquivo_encrypted = f"{arquivo_log}.enc"
-            with open(arquivo_encrypted, 'wb') as f:
-                f.write(criptografado)
+            with open(arquivo_log, 'rb', buffering=0) as origem, \
+                    open(arquivo_encrypted, 'wb') as destino:
+                destino.write(CABECALHO_LOG_AESGCM + nonce + bytes(16))
+                while True:
+                    lidos = origem.readinto(entrada)
+                    if not lidos:
+                        break
+                    cifrados = encryptor.update_into(v_entrada[:lidos], saida)
+                    destino.write(v_saida[:cifrados])
+                encryptor.finalize()
+                destino.seek(len(CABECALHO_LOG_AESGCM) + len(nonce))
+                destino.write(encryptor.tag)
             os.remove(arquivo_log)
             
             arquivos = dict(self.metadata_voo.get('arquivos', {}))
             arquivos['log'] = os.path.basename(arquivo_encrypted)
             self._salvar_metadata_voo({
                 "log_encrypted": True,
+                "log_cipher": "AES-256-GCM",
                 "arquivos": arquivos
             })
             self._log("Log do voo criptografado com sucesso")
@@ -876,6 +1910,7 @@ class GPSControl:
         # Ativa modo simulação
         self.modo_simulacao = True
         self.velocidade_media_simulacao = velocidade_media
+        self._sim_stop.clear()
         
         # Inicia thread de simulação
         self.thread_simulacao = threading.Thread(
@@ -887,33 +1922,51 @@ class GPSControl:
         self._log(f"Simulação iniciada - Velocidade média: {velocidade_media}m/s (20 tubos)")
         return True
     
+    def parar_simulacao(self):
+        """
+        Cancela a simulação em andamento
+        
+        Returns:
+            bool: True se havia simulação rodando
+        """
+        rodando = self.thread_simulacao is not None and self.thread_simulacao.is_alive()
+        self._sim_stop.set()
+        self.modo_simulacao = False
+        if rodando:
+            self._log("Simulação cancelada")
+        return rodando
+    
     def _thread_simulacao(self):
         """Thread que simula um voo realista de 20 tubos"""
-        import random
+        # Gerador próprio da thread (sem o estado global compartilhado do random)
+        rng = random.Random()
+        uniform, choices = rng.uniform, rng.choices
         
         try:
             # Simula GPS conectado com bons satélites
             self.gps_status = "CONECTADO"
-            self.num_satelites = random.randint(8, 12)
-            self.pdop_atual = random.uniform(1.5, 2.5)
+            self.num_satelites = rng.randint(8, 12)
+            self.pdop_atual = uniform(1.5, 2.5)
             self.coordenadas_atuais = "-23.550520,-46.633308"  # Coordenada exemplo
             
             # Aguarda um pouco
-            time.sleep(1)
+            if self._sim_stop.wait(1):
+                return
             
             # Prepara voo
             self._preparar_voo()
             self.ciclo_atual = 1
             self.estado_sistema = "AGUARDANDO_MOVIMENTO"
             
-            time.sleep(2)
+            if self._sim_stop.wait(2):
+                return
             
             # Simula primeiro movimento (Ciclo 1 → 2)
             self._log("SIMULAÇÃO: Movimento detectado")
             self.ciclo_atual = 2
             self.estado_sistema = "EM_MOVIMENTO"
             self.ultima_posicao = (-23.550520, -46.633308)
-            self.tempo_inicio_voo = time.time()
+            self.tempo_inicio_voo = time.monotonic()
             
             # Ciclo 3: Operação - 20 tubos
             self.ciclo_atual = 3
@@ -921,34 +1974,55 @@ class GPSControl:
             
             posicao_alternada = False
             
-            for tubo in range(20):
+            # Sorteios da simulação feitos de uma vez (20 tubos × passos)
+            tubos, passos = 20, 10
+            variacoes = [uniform(0.7, 1.3) for _ in range(tubos)]
+            perturbar = choices((True, False), weights=(1, 4), k=tubos * passos)
+            sat_deltas = choices((-1, 0, 1), k=tubos * passos)
+            pdop_deltas = [uniform(-0.3, 0.3) for _ in range(tubos * passos)]
+            incremento = self.distancia_metros / passos
+            
+            # Trajeto dos tubos: cada ponto avança tubo × 0.0001° sobre o anterior
+            lat0, lon0 = self.ultima_posicao
+            if np is not None:
+                deslocamentos = np.cumsum(np.arange(tubos, dtype=np.float64)) * 0.0001
+                lats = (lat0 + deslocamentos).tolist()
+                lons = (lon0 + deslocamentos).tolist()
+            else:
+                lats, lons = [], []
+                lat, lon = lat0, lon0
+                for tubo in range(tubos):
+                    lat += tubo * 0.0001
+                    lon += tubo * 0.0001
+                    lats.append(lat)
+                    lons.append(lon)
+            proximo_passo = time.monotonic()
+            
+            for tubo in range(tubos):
                 # Variação inteligente de velocidade (±30% da média)
-                variacao = random.uniform(0.7, 1.3)
-                velocidade_atual = self.velocidade_media_simulacao * variacao
+                velocidade_atual = self.velocidade_media_simulacao * variacoes[tubo]
                 self.ultima_velocidade = velocidade_atual
                 
                 # Calcula tempo para percorrer a distância
                 tempo_percurso = self.distancia_metros / velocidade_atual
+                intervalo = tempo_percurso / passos
                 
-                # Simula o percurso gradualmente
-                passos = 10
-                for _ in range(passos):
-                    if not self.modo_simulacao:  # Permite cancelar
+                # Simula o percurso gradualmente (prazos absolutos, sem deriva)
+                for i in range(tubo * passos, (tubo + 1) * passos):
+                    # Espera até o prazo do passo; retorna na hora se cancelada
+                    proximo_passo += intervalo
+                    if self._sim_stop.wait(max(0.0, proximo_passo - time.monotonic())):
                         return
-                    
-                    time.sleep(tempo_percurso / passos)
-                    self.distancia_acumulada += self.distancia_metros / passos
+                    self.distancia_acumulada += incremento
                     
                     # Varia satélites e PDOP levemente
-                    if random.random() < 0.2:
-                        self.num_satelites = max(5, min(12, self.num_satelites + random.choice([-1, 0, 1])))
-                        self.pdop_atual = max(1.5, min(4.0, self.pdop_atual + random.uniform(-0.3, 0.3)))
+                    if perturbar[i]:
+                        self.num_satelites = max(5, min(12, self.num_satelites + sat_deltas[i]))
+                        self.pdop_atual = max(1.5, min(4.0, self.pdop_atual + pdop_deltas[i]))
                 
                 # Chegou na distância - aciona servo
-                self._log(f"SIMULAÇÃO: Tubo {tubo + 1}/20 lançado")
-                nova_lat = self.ultima_posicao[0] + (tubo * 0.0001)
-                nova_lon = self.ultima_posicao[1] + (tubo * 0.0001)
-                nova_posicao = (nova_lat, nova_lon)
+                self._log("SIMULAÇÃO: Tubo %d/%d lançado", "info", tubo + 1, tubos)
+                nova_posicao = (lats[tubo], lons[tubo])
                 
                 self._gravar_coordenada(nova_posicao)
                 self.servo_control.mover_operacao(posicao_alternada)
@@ -958,7 +2032,8 @@ class GPSControl:
                 self.distancia_acumulada = 0
             
             # Finaliza voo
-            time.sleep(2)
+            if self._sim_stop.wait(2):
+                return
             self._log("SIMULAÇÃO: Finalizando voo")
             self._finalizar_voo()
             
@@ -980,6 +2055,11 @@ class GPSControl:
 
     def set_gps_frequency(self, hz):
         hz = max(1, min(10, int(hz)))
+        config_manager = getattr(self, '_config_manager', None)
+        if (hz == self._frequencia_gps_hz and config_manager is not None
+                and config_manager.get('gps.frequency_hz') == hz):
+            # Nada mudou: evita gravar a configuração e reconfigurar o GPS
+            return hz
         if hz not in self._frequencias_disponiveis:
             self.logger.warning('Frequência %s Hz não é suportada; usando mais próxima', hz)
         self._frequencia_gps_hz = hz
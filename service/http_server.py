@@ -5,29 +5,249 @@ Servidor HTTP REST para o Sistema Cotesia
 Expõe API para controle remoto via WiFi
 """
 
-import sys
 import os
 import signal
 import json
 import base64
-import glob
+import gzip
+import io
+import re
 import shutil
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
+import tarfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from types import MappingProxyType
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import pybase64
+except ImportError:  # pragma: no cover
+    pybase64 = None
+
+# base64 com SIMD (pybase64) quando instalado; mesma saída do stdlib
+_b64encode = pybase64.b64encode if pybase64 is not None else base64.b64encode
 
 # Importa módulos do serviço
 from logger import configurar_logging
 from servo_control import ServoControl
 from gps_control import GPSControl
 
+# Bloco de leitura dos arquivos de voo; múltiplo de 3 para que cada bloco
+# vire base64 completo (sem '=' no meio do arquivo)
+BLOCO_BASE64 = 48 * 1024
+
+# Respostas de /flights/{numero} mantidas em memória (LRU): quantos voos e
+# tamanho máximo de uma resposta para entrar no cache
+VOOS_EM_CACHE = 4
+LIMITE_CACHE_VOO = 8 * 1024 * 1024
+
+# Parâmetros do GPS usados no início do serviço (somente leitura)
+CONFIG_GPS = MappingProxyType({
+    'distancia_metros': 25,
+    'tempo_parada': 10,
+    'velocidade_operacao': 5.0,
+    'precisao_minima_satelites': 3,
+    'pdop_maximo': 6.0,
+    'first_movement_threshold': 5.0,
+    'velocidade_parada': 1.5
+})
+
+# Intervalo (s) entre reconstruções do índice de /flights/list
+INTERVALO_INDICE_VOOS = 5.0
+
+# Conexões atendidas ao mesmo tempo (uma thread cada); acima disso a nova
+# conexão recebe 503 na hora
+MAX_CONEXOES = 16
+
+# Tamanho máximo aceito no corpo de um POST (configurações têm poucos KB)
+CORPO_POST_MAXIMO = 1024 * 1024
+
+# Respostas JSON acima deste tamanho vão em gzip (nível 1) se o cliente aceitar
+GZIP_MINIMO = 512
+
+# /flights/{numero}[/raw/{arquivo} | /tar]; grupo 1 é None se o número não
+# for dígitos (responde 400), grupo 2 é o nome do arquivo da rota raw e o
+# grupo 3 é preenchido na rota tar
+_FLIGHT_RE = re.compile(r'/flights/(?:(\d+)|[^/]+)(?:/raw/([^/]+)|/(tar))?', re.IGNORECASE)
+
+
+def _json_dumps(dados):
+    """Serializa resposta em JSON UTF-8 (orjson se disponível)"""
+    if orjson is not None:
+        return orjson.dumps(dados, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(dados, ensure_ascii=False).encode('utf-8')
+
+
+def _json_loads(corpo):
+    """Interpreta corpo JSON em bytes (orjson se disponível)"""
+    if orjson is not None:
+        return orjson.loads(corpo)
+    return json.loads(corpo)
+
+
+def _normalizar_caminho(alvo):
+    """
+    Path da requisição sem query e sem '/' final
+    
+    Returns:
+        tuple: (path, path em minúsculas para as rotas exatas)
+    """
+    if alvo.startswith('/'):
+        path = alvo.partition('?')[0].partition('#')[0]
+    else:
+        # Forma absoluta (http://host/path), rara: deixa para o urlparse
+        path = urlparse(alvo).path
+    if path.endswith('/'):
+        path = path.rstrip('/') or '/'
+    elif not path:
+        path = '/'
+    # Caminhos já em minúsculas (o normal) não geram outra string
+    return path, path if path.islower() else path.lower()
+
+
+def _ler_metadata(meta_file, logger):
+    """Lê um metadata.json (com '_path' da pasta do voo) ou None se falhar"""
+    try:
+        with open(meta_file, 'rb') as f:
+            dados = _json_loads(f.read())
+        dados['_path'] = os.path.dirname(meta_file)
+        return dados
+    except Exception as e:
+        if logger:
+            logger.warning(f"Falha ao ler metadata {meta_file}: {e}")
+        return None
+
+
+def _procurar_metadata(raiz):
+    """
+    Percorre raiz e subpastas e gera os DirEntry de cada metadata.json
+    
+    Substitui glob('**/metadata.json'): desce só em diretórios (tipo já vem
+    do scandir) e, como o glob, ignora pastas ocultas.
+    """
+    pilha = [raiz]
+    while pilha:
+        try:
+            it = os.scandir(pilha.pop())
+        except OSError:
+            continue
+        with it:
+            for entrada in it:
+                if entrada.name.startswith('.'):
+                    continue
+                if entrada.is_dir():
+                    pilha.append(entrada.path)
+                elif entrada.name == 'metadata.json' and entrada.is_file():
+                    yield entrada
+
+
+class _SaidaChunked:
+    """
+    Arquivo só de escrita que envia cada write como um chunk HTTP/1.1
+    
+    Com chunked=False (cliente HTTP/1.0) escreve os bytes direto; o fim do
+    corpo é o fechamento da conexão.
+    """
+    
+    def __init__(self, wfile, chunked=True):
+        self._wfile = wfile
+        self._chunked = chunked
+    
+    def write(self, dados):
+        if dados:
+            if self._chunked:
+                self._wfile.write(b'%x\r\n' % len(dados))
+                self._wfile.write(dados)
+                self._wfile.write(b'\r\n')
+            else:
+                self._wfile.write(dados)
+        return len(dados)
+    
+    def fechar(self):
+        """Envia o chunk final (tamanho zero)"""
+        if self._chunked:
+            self._wfile.write(b'0\r\n\r\n')
+
+
+# Descrição da API servida em GET / (estática)
+INFO_API = {
+    'service': 'Sistema Cotesia HTTP Server',
+    'version': '1.0.0',
+    'endpoints': {
+        'GET /ping': 'Testa conectividade',
+        'GET /status': 'Status completo do sistema',
+        'GET /config': 'Configurações atuais',
+        'POST /config': 'Atualiza configurações',
+        'POST /servo/test': 'Teste de servos',
+        'POST /servo/reset': 'Reset servos',
+        'POST /servo/angle': 'Ajuste manual de servo',
+        'GET /servo/calibration': 'Obtém calibração',
+        'POST /servo/calibration': 'Atualiza calibração',
+        'GET /gps/settings': 'Configuração atual do GPS',
+        'POST /gps/frequency': 'Atualiza frequência do GPS',
+        'POST /system/boot': 'Inicializa GPIO',
+        'POST /system/reset': 'Reset completo',
+        'POST /flight/start': 'Inicia voo',
+        'POST /flight/stop': 'Para voo',
+        'POST /flight/simulate': 'Inicia simulação',
+        'POST /flight/simulate/stop': 'Para simulação',
+        'GET /flights/list': 'Lista voos',
+        'GET /flights/{numero}': 'Dados do voo',
+        'GET /flights/{numero}/raw/{arquivo}': 'Arquivo do voo (bytes)',
+        'GET /flights/{numero}/tar': 'Voo completo em tar (streaming)',
+        'DELETE /flights/{numero}': 'Apaga voo'
+    }
+}
+_INFO_API_JSON = _json_dumps(INFO_API)
+
+# Resposta fixa de GET /ping (consultado com frequência pelo app)
+_PING_JSON = _json_dumps({'status': 'ok', 'message': 'PONG'})
+
+# Resposta crua enviada quando todas as vagas de conexão estão ocupadas
+_OCUPADO_JSON = _json_dumps({'status': 'error', 'message': 'Servidor ocupado, tente novamente'})
+_RESPOSTA_OCUPADO = (
+    b'HTTP/1.1 503 Service Unavailable\r\n'
+    b'Content-Type: application/json\r\n'
+    b'Content-Length: ' + str(len(_OCUPADO_JSON)).encode('ascii') + b'\r\n'
+    b'Retry-After: 1\r\n'
+    b'Access-Control-Allow-Origin: *\r\n'
+    b'Connection: close\r\n'
+    b'\r\n' + _OCUPADO_JSON
+)
+
 
 class CotesiaHTTPHandler(BaseHTTPRequestHandler):
     """Handler para requisições HTTP"""
     
-    servo_control = None
-    gps_control = None
-    logger = None
-    pasta_backup = None
+    # HTTP/1.1: a conexão fica aberta entre requisições (polling de /status
+    # e /ping sem novo handshake TCP); toda resposta leva Content-Length.
+    # Conexão ociosa é fechada após `timeout` segundos (curto: cada conexão
+    # aberta ocupa uma das MAX_CONEXOES vagas)
+    protocol_version = 'HTTP/1.1'
+    timeout = 15
+    
+    # Com uma thread por conexão, comandos de servo/GPS de clientes
+    # diferentes não podem se intercalar
+    _lock_hardware = threading.Lock()
+    
+    # Cache de metadata.json usado na busca por número (o handler é
+    # recriado a cada requisição): caminho -> (assinatura de mtime/tamanho,
+    # metadata ou None)
+    _cache_metadata = {}
+    _lock_cache_metadata = threading.Lock()
+    
+    # Cache de /flights/{numero}: numero -> (assinatura dos arquivos, resposta)
+    _cache_dados_voo = OrderedDict()
+    _lock_cache_dados_voo = threading.Lock()
     
     def do_OPTIONS(self):
         """Trata requisições OPTIONS para CORS"""
@@ -35,419 +255,467 @@ class CotesiaHTTPHandler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, DELETE, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def do_GET(self):
         """Processa requisições GET"""
-        parsed = urlparse(self.path)
-        raw_path = parsed.path or '/'
-        path = raw_path.rstrip('/') or '/'
-        path_lower = path.lower()
+        path, path_lower = _normalizar_caminho(self.path)
         
         try:
-            # PING - Teste de conectividade
-            if path_lower == '/ping':
-                self.send_json({'status': 'ok', 'message': 'PONG'})
-            
-            # STATUS - Status completo do sistema
-            elif path_lower == '/status':
-                status = self.gps_control.get_status()
-                status.update({
-                    'servos_estado': self.servo_control.get_estado(),
-                    'pasta_backup': self.pasta_backup
-                })
-                self.send_json({'status': 'ok', 'data': status})
-            
-            # CONFIG - Configurações atuais
-            elif path_lower == '/config':
-                config = self.gps_control.get_config()
-                self.send_json({'status': 'ok', 'config': config})
-
-            # GPS/SETTINGS - Configuração atual do GPS
-            elif path_lower == '/gps/settings':
-                if hasattr(self.gps_control, 'get_gps_settings'):
-                    settings = self.gps_control.get_gps_settings()
-                    self.send_json({'status': 'ok', 'data': settings})
-                else:
-                    self.send_json(
-                        {'status': 'error', 'message': 'Endpoint não disponível nesta versão'},
-                        501
-                    )
-
-            # SERVO/CALIBRATION - Calibração atual
-            elif path_lower == '/servo/calibration':
-                if hasattr(self.servo_control, 'get_calibration'):
-                    if self.logger:
-                        self.logger.debug("GET /servo/calibration usando método get_calibration()")
-                    calibration = self.servo_control.get_calibration()
-                else:
-                    calibration = getattr(self.servo_control, 'calibration', None)
-                    if self.logger:
-                        self.logger.warning(
-                            "GET /servo/calibration: método get_calibration() ausente; retornando atributo bruto"
-                            if calibration is not None else
-                            "GET /servo/calibration: calibração indisponível nesta versão"
-                        )
-                if calibration is not None:
-                    self.send_json({'status': 'ok', 'calibration': calibration})
-                else:
-                    self.send_json(
-                        {'status': 'error', 'message': 'Função de calibração não disponível nesta versão'},
-                        501
-                    )
-                return
-            
-            elif path_lower == '/servo/calibration/measure':
-                if hasattr(self.servo_control, 'medir_calibracao'):
-                    if self.logger:
-                        self.logger.info("Executando medição automática de calibração dos servos")
-                    calibration = self.servo_control.medir_calibracao()
-                    self.send_json({'status': 'ok', 'calibration': calibration})
-                else:
-                    if self.logger:
-                        self.logger.warning("Medição de calibração não suportada nesta versão")
-                    self.send_json(
-                        {'status': 'error', 'message': 'Medição automática não disponível nesta versão'},
-                        501
-                    )
+            rota = self._ROTAS_GET.get(path_lower)
+            if rota is not None:
+                rota(self)
                 return
             
-            # FLIGHTS/LIST - Lista todos os voos
-            elif path == '/flights/list':
-                flights = self._listar_voos()
-                self.send_json({'status': 'ok', 'flights': flights})
-            
             # FLIGHTS/{numero} - Dados de um voo específico
-            elif path_lower.startswith('/flights/') and len(path.split('/')) == 3:
-                numero = path.split('/')[-1]
-                if numero.isdigit():
-                    flight_data = self._obter_dados_voo(int(numero))
-                    if flight_data:
-                        self.send_json({'status': 'ok', 'flight': flight_data})
-                    else:
-                        self.send_json({'status': 'error', 'message': 'Voo não encontrado'}, 404)
-                else:
-                    self.send_json({'status': 'error', 'message': 'Número de voo inválido'}, 400)
-            
-            # ROOT - Informações da API
-            elif path_lower == '/':
-                self.send_json({
-                    'service': 'Sistema Cotesia HTTP Server',
-                    'version': '1.0.0',
-                    'endpoints': {
-                        'GET /ping': 'Testa conectividade',
-                        'GET /status': 'Status completo do sistema',
-                        'GET /config': 'Configurações atuais',
-                        'POST /config': 'Atualiza configurações',
-                        'POST /servo/test': 'Teste de servos',
-                        'POST /servo/reset': 'Reset servos',
-                        'POST /servo/angle': 'Ajuste manual de servo',
-                        'GET /servo/calibration': 'Obtém calibração',
-                        'POST /servo/calibration': 'Atualiza calibração',
-                        'GET /gps/settings': 'Configuração atual do GPS',
-                        'POST /gps/frequency': 'Atualiza frequência do GPS',
-                        'POST /system/boot': 'Inicializa GPIO',
-                        'POST /system/reset': 'Reset completo',
-                        'POST /flight/start': 'Inicia voo',
-                        'POST /flight/stop': 'Para voo',
-                        'GET /flights/list': 'Lista voos',
-                        'GET /flights/{numero}': 'Dados do voo',
-                        'DELETE /flights/{numero}': 'Apaga voo'
-                    }
-                })
-            
-            else:
+            # FLIGHTS/{numero}/RAW/{arquivo} - Arquivo do voo sem base64
+            # FLIGHTS/{numero}/TAR - Todos os arquivos do voo num tar
+            m = _FLIGHT_RE.fullmatch(path)
+            if m is None:
                 self.send_json({'status': 'error', 'message': 'Endpoint não encontrado'}, 404)
+            elif m.group(1) is None:
+                self.send_json({'status': 'error', 'message': 'Número de voo inválido'}, 400)
+            elif m.group(2) is not None:
+                self._enviar_arquivo_voo(int(m.group(1)), m.group(2))
+            elif m.group(3) is not None:
+                self._enviar_tar_voo(int(m.group(1)))
+            else:
+                numero = int(m.group(1))
+                flight_data = self._obter_dados_voo(numero)
+                if flight_data:
+                    self._enviar_dados_voo(numero, *flight_data)
+                else:
+                    self.send_json({'status': 'error', 'message': 'Voo não encontrado'}, 404)
         
         except Exception as e:
-            if self.logger:
-                self.logger.error(f"Erro no GET: {e}", exc_info=True)
+            if self.server.logger:
+                self.server.logger.error(f"Erro no GET: {e}", exc_info=True)
             self.send_json({'status': 'error', 'message': str(e)}, 500)
     
+    def _get_ping(self):
+        """PING - Teste de conectividade"""
+        self._enviar_json_bytes(_PING_JSON)
+    
+    def _get_status(self):
+        """STATUS - Status completo do sistema"""
+        status = self.server.gps_control.get_status()
+        status.update({
+            'servos_estado': self.server.servo_control.get_estado(),
+            'pasta_backup': self.server.pasta_backup
+        })
+        self.send_json({'status': 'ok', 'data': status})
+    
+    def _get_config(self):
+        """CONFIG - Configurações atuais"""
+        config = self.server.gps_control.get_config()
+        self.send_json({'status': 'ok', 'config': config})
+    
+    def _get_gps_settings(self):
+        """GPS/SETTINGS - Configuração atual do GPS"""
+        if 'get_gps_settings' in self.server.recursos:
+            settings = self.server.gps_control.get_gps_settings()
+            self.send_json({'status': 'ok', 'data': settings})
+        else:
+            self.send_json(
+                {'status': 'error', 'message': 'Endpoint não disponível nesta versão'},
+                501
+            )
+    
+    def _get_servo_calibration(self):
+        """SERVO/CALIBRATION - Calibração atual"""
+        if 'get_calibration' in self.server.recursos:
+            if self.server.logger:
+                self.server.logger.debug("GET /servo/calibration usando método get_calibration()")
+            calibration = self.server.servo_control.get_calibration()
+        else:
+            calibration = getattr(self.server.servo_control, 'calibration', None)
+            if self.server.logger:
+                self.server.logger.warning(
+                    "GET /servo/calibration: método get_calibration() ausente; retornando atributo bruto"
+                    if calibration is not None else
+                    "GET /servo/calibration: calibração indisponível nesta versão"
+                )
+        if calibration is not None:
+            self.send_json({'status': 'ok', 'calibration': calibration})
+        else:
+            self.send_json(
+                {'status': 'error', 'message': 'Função de calibração não disponível nesta versão'},
+                501
+            )
+    
+    def _get_servo_calibration_measure(self):
+        """SERVO/CALIBRATION/MEASURE - Medição automática de calibração"""
+        if 'medir_calibracao' in self.server.recursos:
+            if self.server.logger:
+                self.server.logger.info("Executando medição automática de calibração dos servos")
+            calibration = self._chamar_hardware(self.server.servo_control.medir_calibracao)
+            self.send_json({'status': 'ok', 'calibration': calibration})
+        else:
+            if self.server.logger:
+                self.server.logger.warning("Medição de calibração não suportada nesta versão")
+            self.send_json(
+                {'status': 'error', 'message': 'Medição automática não disponível nesta versão'},
+                501
+            )
+    
+    def _get_flights_list(self):
+        """FLIGHTS/LIST - Lista todos os voos (índice mantido pelo servidor)"""
+        self._enviar_json_bytes(self.server.indice_voos)
+    
+    def _get_raiz(self):
+        """ROOT - Informações da API (JSON serializado uma vez, no import)"""
+        self._enviar_json_bytes(_INFO_API_JSON)
+    
     def do_POST(self):
         """Processa requisições POST"""
-        parsed = urlparse(self.path)
-        raw_path = parsed.path or '/'
-        path = raw_path.rstrip('/') or '/'
-        path_lower = path.lower()
+        path, path_lower = _normalizar_caminho(self.path)
         
         try:
-            # Lê body
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = self.rfile.read(content_length).decode('utf-8') if content_length > 0 else '{}'
-            data = json.loads(body) if body else {}
-            
-            body_data = data
-
-            # SERVO/TEST - Teste de servos
-            if path_lower == '/servo/test':
-                success = self.servo_control.teste()
-                if success:
-                    self.send_json({'status': 'ok', 'message': 'Teste executado'})
-                else:
-                    self.send_json({'status': 'error', 'message': 'Falha no teste'}, 500)
-            
-            # SERVO/RESET - Reset servos
-            elif path_lower == '/servo/reset':
-                success = self.servo_control.reset()
-                if success:
-                    self.send_json({'status': 'ok', 'message': 'Servos resetados'})
-                else:
-                    self.send_json({'status': 'error', 'message': 'Falha no reset'}, 500)
-            
-            # SERVO/ANGLE - Ajuste manual de servo
-            elif path_lower == '/servo/angle':
-                servo = body_data.get('servo')
-                valor = body_data.get('value')
-                
-                if valor is None and 'degrees' in body_data:
-                    try:
-                        graus = float(body_data.get('degrees'))
-                        valor = (graus / 90.0) - 1.0
-                    except (TypeError, ValueError):
-                        valor = None
-                
-                try:
-                    servo = int(servo)
-                except (TypeError, ValueError):
-                    servo = None
-                
-                if servo in (1, 2) and valor is not None:
-                    success = self.servo_control.ajustar_servo(servo, valor)
-                    if success:
-                        estado = self.servo_control.get_estado()
-                        self.send_json({
-                            'status': 'ok',
-                            'message': f'Servo {servo} ajustado',
-                            'servo_estado': estado
-                        })
-                    else:
-                        self.send_json({'status': 'error', 'message': 'Falha ao ajustar servo'}, 500)
-                else:
-                    self.send_json(
-                        {'status': 'error', 'message': 'Informe servo (1 ou 2) e value'}, 400
-                    )
-
-            # SERVO/CALIBRATION - Atualiza calibração
-            elif path_lower == '/servo/calibration':
-                calibration = body_data.get('calibration')
-                if calibration:
-                    if hasattr(self.servo_control, 'set_calibration'):
-                        if self.logger:
-                            self.logger.debug("POST /servo/calibration usando set_calibration()")
-                        success = self.servo_control.set_calibration(calibration)
-                    else:
-                        success = False
-                        if self.logger:
-                            self.logger.warning("POST /servo/calibration: método set_calibration() ausente nesta versão")
-                else:
-                    success = False
-                    if self.logger:
-                        self.logger.warning("POST /servo/calibration: calibração ausente")
-                if success:
-                    self.send_json({'status': 'ok', 'message': 'Calibração atualizada'})
-                else:
-                    self.send_json(
-                        {'status': 'error', 'message': 'Calibração não suportada nesta versão'},
-                        501
-                    )
-            
-            elif path_lower == '/servo/calibration/detect':
-                if hasattr(self.servo_control, 'detectar_limites'):
-                    if self.logger:
-                        self.logger.debug("POST /servo/calibration/detect: executando detecção de limites")
-                    limites = self.servo_control.detectar_limites()
-                    if limites:
-                        self.send_json({'status': 'ok', 'calibration': limites})
-                    else:
-                        self.send_json(
-                            {'status': 'error', 'message': 'Falha na detecção de limites'},
-                            500
-                        )
-                else:
-                    if self.logger:
-                        self.logger.warning("POST /servo/calibration/detect indisponível nesta versão")
-                    self.send_json(
-                        {'status': 'error', 'message': 'Detecção automática não disponível nesta versão'},
-                        501
-                    )
-            
-            elif path_lower == '/servo/calibration/measure':
-                if hasattr(self.servo_control, 'medir_calibracao'):
-                    if self.logger:
-                        self.logger.info("POST /servo/calibration/measure: executando medição")
-                    calibration = self.servo_control.medir_calibracao()
-                    self.send_json({'status': 'ok', 'calibration': calibration})
-                else:
-                    if self.logger:
-                        self.logger.warning("POST /servo/calibration/measure: não suportado nesta versão")
-                    self.send_json(
-                        {'status': 'error', 'message': 'Medição automática não disponível nesta versão'},
-                        501
-                    )
-            
-            # GPS/FREQUENCY - Ajustar frequência do GPS
-            elif path_lower == '/gps/frequency':
-                if not hasattr(self.gps_control, 'set_gps_frequency'):
-                    self.send_json(
-                        {'status': 'error', 'message': 'Endpoint não disponível nesta versão'},
-                        501
-                    )
-                else:
-                    hz = body_data.get('frequency_hz')
-                    if hz is None:
-                        self.send_json(
-                            {'status': 'error', 'message': 'frequency_hz obrigatório'},
-                            400
-                        )
-                    else:
-                        try:
-                            hz_aplicado = self.gps_control.set_gps_frequency(hz)
-                            self.send_json({'status': 'ok', 'data': {'frequency_hz': hz_aplicado}})
-                        except Exception as exc:
-                            if self.logger:
-                                self.logger.error('Erro ao ajustar frequência do GPS: %s', exc, exc_info=True)
-                            self.send_json(
-                                {'status': 'error', 'message': str(exc)},
-                                500
-                            )
-
-            # SYSTEM/BOOT - Inicializa GPIO
-            elif path_lower == '/system/boot':
-                if self.servo_control.inicializado:
-                    self.send_json({'status': 'ok', 'message': 'Sistema já inicializado'})
-                else:
-                    success = self.servo_control.inicializar_gpio()
-                    if success:
-                        self.send_json({'status': 'ok', 'message': 'Sistema inicializado'})
-                    else:
-                        self.send_json({'status': 'error', 'message': 'Falha na inicialização'}, 500)
-            
-            # SYSTEM/RESET - Reset completo
-            elif path_lower == '/system/reset':
-                success = self.gps_control.resetar_sistema()
-                if success:
-                    self.send_json({'status': 'ok', 'message': 'Sistema resetado'})
-                else:
-                    self.send_json({'status': 'error', 'message': 'Falha no reset'}, 500)
-            
-            # FLIGHT/START - Inicia voo
-            elif path_lower == '/flight/start':
-                success = self.gps_control.iniciar_voo()
-                if success:
-                    self.send_json({'status': 'ok', 'message': 'Voo iniciado'})
-                else:
-                    self.send_json({'status': 'error', 'message': 'Não foi possível iniciar voo'}, 400)
-            
-            # FLIGHT/STOP - Para voo
-            elif path_lower == '/flight/stop':
-                success = self.gps_control.parar_voo()
-                if success:
-                    self.send_json({'status': 'ok', 'message': 'Voo parado'})
-                else:
-                    self.send_json({'status': 'error', 'message': 'Falha ao parar voo'}, 500)
-            
-            # FLIGHT/SIMULATE - Inicia simulação
-            elif path_lower == '/flight/simulate':
-                if hasattr(self.gps_control, 'iniciar_simulacao'):
-                    if self.logger:
-                        self.logger.debug("POST /flight/simulate chamando iniciar_simulacao()")
-                    velocidade_media = data.get('velocidade_media', 12)
-                    success = self.gps_control.iniciar_simulacao(velocidade_media)
-                    if success:
-                        self.send_json({'status': 'ok', 'message': 'Simulação iniciada'})
-                    else:
-                        self.send_json({'status': 'error', 'message': 'Não foi possível iniciar simulação'}, 400)
-                else:
-                    if self.logger:
-                        self.logger.warning("POST /flight/simulate: método iniciar_simulacao() ausente nesta versão")
-                    self.send_json(
-                        {'status': 'error', 'message': 'Simulação não disponível nesta versão'},
-                        501
-                    )
-            
-            # CONFIG - Atualiza configurações
-            elif path_lower == '/config':
-                success = self.gps_control.set_config(data)
-                if success:
-                    self.send_json({'status': 'ok', 'message': 'Configurações atualizadas'})
-                else:
-                    self.send_json({'status': 'error', 'message': 'Falha ao atualizar'}, 500)
+            # Lê body (com keep-alive, um corpo não lido corromperia a próxima
+            # requisição da conexão: sem tamanho válido, fecha)
+            try:
+                content_length = int(self.headers.get('Content-Length', 0))
+            except ValueError:
+                self.close_connection = True
+                self.send_json({'status': 'error', 'message': 'Content-Length inválido'}, 400)
+                return
+            if content_length > CORPO_POST_MAXIMO:
+                # Recusa antes de ler: o corpo fica no socket, então fecha
+                self.close_connection = True
+                self.send_json({'status': 'error', 'message': 'Corpo da requisição muito grande'}, 413)
+                return
+            body = self.rfile.read(content_length) if content_length > 0 else b''
+            data = _json_loads(body) if body else {}
             
+            rota = self._ROTAS_POST.get(path_lower)
+            if rota is not None:
+                rota(self, data)
             else:
-                self.send_json({'status': 'error', 'message': f'Endpoint não encontrado ({raw_path})'}, 404)
+                self.send_json({'status': 'error', 'message': f'Endpoint não encontrado ({path})'}, 404)
         
         except json.JSONDecodeError:
             self.send_json({'status': 'error', 'message': 'JSON inválido'}, 400)
         except Exception as e:
-            if self.logger:
-                self.logger.error(f"Erro no POST: {e}", exc_info=True)
+            if self.server.logger:
+                self.server.logger.error(f"Erro no POST: {e}", exc_info=True)
             self.send_json({'status': 'error', 'message': str(e)}, 500)
     
+    def _post_servo_test(self, data):
+        """SERVO/TEST - Teste de servos"""
+        success = self._chamar_hardware(self.server.servo_control.teste)
+        if success:
+            self.send_json({'status': 'ok', 'message': 'Teste executado'})
+        else:
+            self.send_json({'status': 'error', 'message': 'Falha no teste'}, 500)
+    
+    def _post_servo_reset(self, data):
+        """SERVO/RESET - Reset servos"""
+        success = self._chamar_hardware(self.server.servo_control.reset)
+        if success:
+            self.send_json({'status': 'ok', 'message': 'Servos resetados'})
+        else:
+            self.send_json({'status': 'error', 'message': 'Falha no reset'}, 500)
+    
+    def _post_servo_angle(self, data):
+        """SERVO/ANGLE - Ajuste manual de servo"""
+        servo = data.get('servo')
+        valor = data.get('value')
+
+        if valor is None and 'degrees' in data:
+            try:
+                graus = float(data.get('degrees'))
+                valor = (graus / 90.0) - 1.0
+            except (TypeError, ValueError):
+                valor = None
+
+        try:
+            servo = int(servo)
+        except (TypeError, ValueError):
+            servo = None
+
+        if servo in (1, 2) and valor is not None:
+            success = self._chamar_hardware(self.server.servo_control.ajustar_servo, servo, valor)
+            if success:
+                estado = self.server.servo_control.get_estado()
+                self.send_json({
+                    'status': 'ok',
+                    'message': f'Servo {servo} ajustado',
+                    'servo_estado': estado
+                })
+            else:
+                self.send_json({'status': 'error', 'message': 'Falha ao ajustar servo'}, 500)
+        else:
+            self.send_json(
+                {'status': 'error', 'message': 'Informe servo (1 ou 2) e value'}, 400
+            )
+    
+    def _post_servo_calibration(self, data):
+        """SERVO/CALIBRATION - Atualiza calibração"""
+        calibration = data.get('calibration')
+        if calibration:
+            if 'set_calibration' in self.server.recursos:
+                if self.server.logger:
+                    self.server.logger.debug("POST /servo/calibration usando set_calibration()")
+                success = self._chamar_hardware(self.server.servo_control.set_calibration, calibration)
+            else:
+                success = False
+                if self.server.logger:
+                    self.server.logger.warning("POST /servo/calibration: método set_calibration() ausente nesta versão")
+        else:
+            success = False
+            if self.server.logger:
+                self.server.logger.warning("POST /servo/calibration: calibração ausente")
+        if success:
+            self.send_json({'status': 'ok', 'message': 'Calibração atualizada'})
+        else:
+            self.send_json(
+                {'status': 'error', 'message': 'Calibração não suportada nesta versão'},
+                501
+            )
+    
+    def _post_servo_calibration_detect(self, data):
+        """SERVO/CALIBRATION/DETECT - Detecção automática de limites"""
+        if 'detectar_limites' in self.server.recursos:
+            if self.server.logger:
+                self.server.logger.debug("POST /servo/calibration/detect: executando detecção de limites")
+            limites = self._chamar_hardware(self.server.servo_control.detectar_limites)
+            if limites:
+                self.send_json({'status': 'ok', 'calibration': limites})
+            else:
+                self.send_json(
+                    {'status': 'error', 'message': 'Falha na detecção de limites'},
+                    500
+                )
+        else:
+            if self.server.logger:
+                self.server.logger.warning("POST /servo/calibration/detect indisponível nesta versão")
+            self.send_json(
+                {'status': 'error', 'message': 'Detecção automática não disponível nesta versão'},
+                501
+            )
+    
+    def _post_servo_calibration_measure(self, data):
+        """SERVO/CALIBRATION/MEASURE - Medição automática de calibração"""
+        if 'medir_calibracao' in self.server.recursos:
+            if self.server.logger:
+                self.server.logger.info("POST /servo/calibration/measure: executando medição")
+            calibration = self._chamar_hardware(self.server.servo_control.medir_calibracao)
+            self.send_json({'status': 'ok', 'calibration': calibration})
+        else:
+            if self.server.logger:
+                self.server.logger.warning("POST /servo/calibration/measure: não suportado nesta versão")
+            self.send_json(
+                {'status': 'error', 'message': 'Medição automática não disponível nesta versão'},
+                501
+            )
+    
+    def _post_gps_frequency(self, data):
+        """GPS/FREQUENCY - Ajustar frequência do GPS"""
+        if 'set_gps_frequency' not in self.server.recursos:
+            self.send_json(
+                {'status': 'error', 'message': 'Endpoint não disponível nesta versão'},
+                501
+            )
+        else:
+            hz = data.get('frequency_hz')
+            if hz is None:
+                self.send_json(
+                    {'status': 'error', 'message': 'frequency_hz obrigatório'},
+                    400
+                )
+            else:
+                try:
+                    hz_aplicado = self._chamar_hardware(self.server.gps_control.set_gps_frequency, hz)
+                    self.send_json({'status': 'ok', 'data': {'frequency_hz': hz_aplicado}})
+                except Exception as exc:
+                    if self.server.logger:
+                        self.server.logger.error('Erro ao ajustar frequência do GPS: %s', exc, exc_info=True)
+                    self.send_json(
+                        {'status': 'error', 'message': str(exc)},
+                        500
+                    )
+    
+    def _post_system_boot(self, data):
+        """SYSTEM/BOOT - Inicializa GPIO"""
+        if self.server.servo_control.inicializado:
+            self.send_json({'status': 'ok', 'message': 'Sistema já inicializado'})
+        else:
+            success = self._chamar_hardware(self.server.servo_control.inicializar_gpio)
+            if success:
+                self.send_json({'status': 'ok', 'message': 'Sistema inicializado'})
+            else:
+                self.send_json({'status': 'error', 'message': 'Falha na inicialização'}, 500)
+    
+    def _post_system_reset(self, data):
+        """SYSTEM/RESET - Reset completo"""
+        success = self._chamar_hardware(self.server.gps_control.resetar_sistema)
+        if success:
+            self.send_json({'status': 'ok', 'message': 'Sistema resetado'})
+        else:
+            self.send_json({'status': 'error', 'message': 'Falha no reset'}, 500)
+    
+    def _post_flight_start(self, data):
+        """FLIGHT/START - Inicia voo"""
+        success = self._chamar_hardware(self.server.gps_control.iniciar_voo)
+        if success:
+            self.send_json({'status': 'ok', 'message': 'Voo iniciado'})
+        else:
+            self.send_json({'status': 'error', 'message': 'Não foi possível iniciar voo'}, 400)
+    
+    def _post_flight_stop(self, data):
+        """FLIGHT/STOP - Para voo"""
+        success = self._chamar_hardware(self.server.gps_control.parar_voo)
+        if success:
+            self.send_json({'status': 'ok', 'message': 'Voo parado'})
+        else:
+            self.send_json({'status': 'error', 'message': 'Falha ao parar voo'}, 500)
+    
+    def _post_flight_simulate(self, data):
+        """FLIGHT/SIMULATE - Inicia simulação"""
+        if 'iniciar_simulacao' in self.server.recursos:
+            if self.server.logger:
+                self.server.logger.debug("POST /flight/simulate chamando iniciar_simulacao()")
+            velocidade_media = data.get('velocidade_media', 12)
+            success = self._chamar_hardware(self.server.gps_control.iniciar_simulacao, velocidade_media)
+            if success:
+                self.send_json({'status': 'ok', 'message': 'Simulação iniciada'})
+            else:
+                self.send_json({'status': 'error', 'message': 'Não foi possível iniciar simulação'}, 400)
+        else:
+            if self.server.logger:
+                self.server.logger.warning("POST /flight/simulate: método iniciar_simulacao() ausente nesta versão")
+            self.send_json(
+                {'status': 'error', 'message': 'Simulação não disponível nesta versão'},
+                501
+            )
+    
+    def _post_flight_simulate_stop(self, data):
+        """FLIGHT/SIMULATE/STOP - Cancela simulação"""
+        if 'parar_simulacao' not in self.server.recursos:
+            self.send_json(
+                {'status': 'error', 'message': 'Simulação não disponível nesta versão'},
+                501
+            )
+            return
+        if self._chamar_hardware(self.server.gps_control.parar_simulacao):
+            self.send_json({'status': 'ok', 'message': 'Simulação parada'})
+        else:
+            self.send_json({'status': 'ok', 'message': 'Nenhuma simulação em andamento'})
+    
+    def _post_config(self, data):
+        """CONFIG - Atualiza configurações"""
+        success = self._chamar_hardware(self.server.gps_control.set_config, data)
+        if success:
+            self.send_json({'status': 'ok', 'message': 'Configurações atualizadas'})
+        else:
+            self.send_json({'status': 'error', 'message': 'Falha ao atualizar'}, 500)
+    
     def do_DELETE(self):
         """Processa requisições DELETE"""
-        parsed = urlparse(self.path)
-        path = parsed.path.rstrip('/') or '/'
+        path, _ = _normalizar_caminho(self.path)
         
         try:
             # DELETE /flights/{numero}
-            if path.startswith('/flights/') and len(path.split('/')) == 3:
-                numero = path.split('/')[-1]
-                if numero.isdigit():
-                    success = self._apagar_voo(int(numero))
-                    if success:
-                        self.send_json({'status': 'ok', 'message': f'Voo {numero} apagado'})
-                    else:
-                        self.send_json({'status': 'error', 'message': 'Voo não encontrado'}, 404)
-                else:
-                    self.send_json({'status': 'error', 'message': 'Número de voo inválido'}, 400)
-            else:
+            m = _FLIGHT_RE.fullmatch(path)
+            if m is None or m.group(2, 3) != (None, None):
                 self.send_json({'status': 'error', 'message': 'Endpoint não encontrado'}, 404)
+            elif m.group(1) is None:
+                self.send_json({'status': 'error', 'message': 'Número de voo inválido'}, 400)
+            else:
+                numero = int(m.group(1))
+                success = self._apagar_voo(numero)
+                if success:
+                    self.send_json({'status': 'ok', 'message': f'Voo {numero} apagado'})
+                else:
+                    self.send_json({'status': 'error', 'message': 'Voo não encontrado'}, 404)
         
         except Exception as e:
-            if self.logger:
-                self.logger.error(f"Erro no DELETE: {e}", exc_info=True)
+            if self.server.logger:
+                self.server.logger.error(f"Erro no DELETE: {e}", exc_info=True)
             self.send_json({'status': 'error', 'message': str(e)}, 500)
     
+    def _chamar_hardware(self, funcao, *args):
+        """Executa um comando de servo/GPS com acesso exclusivo ao hardware"""
+        with self._lock_hardware:
+            return funcao(*args)
+    
     def send_json(self, data, status_code=200):
         """Envia resposta JSON"""
+        self._enviar_json_bytes(_json_dumps(data), status_code)
+    
+    def _enviar_json_bytes(self, body, status_code=200):
+        """Envia resposta JSON já serializada (gzip se o cliente aceitar)"""
+        comprimir = len(body) > GZIP_MINIMO and self._aceita_gzip()
+        if comprimir:
+            body = gzip.compress(body, compresslevel=1)
+        
         self.send_response(status_code)
         self.send_header('Content-Type', 'application/json')
+        if comprimir:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        self.wfile.write(body)
     
-    def log_message(self, format, *args):
-        """Override para usar nosso logger"""
-        if self.logger:
-            self.logger.info(f"{self.address_string()} - {format % args}")
+    def _saida_sem_tamanho(self):
+        """
+        Cabeçalho de enquadramento para corpo de tamanho desconhecido
+        
+        HTTP/1.1 usa Transfer-Encoding: chunked; HTTP/1.0 não entende
+        chunked, então o corpo vai cru e termina com o fechamento da conexão.
+        Chamar antes de end_headers().
+        
+        Returns:
+            _SaidaChunked: destino das escritas do corpo
+        """
+        if self.request_version >= 'HTTP/1.1':
+            self.send_header('Transfer-Encoding', 'chunked')
+            return _SaidaChunked(self.wfile)
+        self.send_header('Connection', 'close')
+        return _SaidaChunked(self.wfile, chunked=False)
     
-    def _listar_voos(self):
-        """Lista todos os voos salvos"""
-        voos = []
-        try:
-            # Estrutura nova (com metadata)
-            for meta in self._iterar_voos_metadata():
-                voos.append(self._montar_info_voo_meta(meta))
-            
-            # Compatibilidade com estrutura antiga
-            voos.extend(self._listar_voos_legado())
-            
-            voos.sort(
-                key=lambda v: (
-                    v.get('data_iso') or '',
-                    v.get('numero') or 0
-                ),
-                reverse=True
-            )
-        except Exception as e:
-            if self.logger:
-                self.logger.error(f"Erro ao listar voos: {e}", exc_info=True)
+    def _aceita_gzip(self):
+        """
+        Cliente aceita resposta em gzip (Accept-Encoding)
         
-        return voos
+        'gzip' com q=0 recusa; '*' vale para gzip se gzip não for citado.
+        """
+        aceita = False
+        for item in self.headers.get('Accept-Encoding', '').split(','):
+            codificacao, _, parametros = item.partition(';')
+            codificacao = codificacao.strip().lower()
+            if codificacao not in ('gzip', '*'):
+                continue
+            q = 1.0
+            for parametro in parametros.split(';'):
+                nome, _, valor = parametro.partition('=')
+                if nome.strip().lower() == 'q':
+                    try:
+                        q = float(valor)
+                    except ValueError:
+                        q = 0.0
+            if codificacao == 'gzip':
+                return q > 0
+            aceita = q > 0
+        return aceita
+    
+    def log_message(self, format, *args):
+        """Override para usar nosso logger"""
+        if self.server.logger:
+            self.server.logger.info(f"{self.address_string()} - {format % args}")
     
     def _obter_dados_voo(self, numero):
-        """Obtém dados completos de um voo (arquivos em base64)"""
+        """
+        Localiza metadata e arquivos de um voo (sem ler o conteúdo)
+        
+        Returns:
+            tuple: (metadata, [(nome, caminho, tamanho, mtime_ns), ...]) ou None
+        """
         try:
             pasta, metadata = self._buscar_voo_por_numero(numero)
             if not pasta or not os.path.exists(pasta):
@@ -458,33 +726,203 @@ class CotesiaHTTPHandler(BaseHTTPRequestHandler):
                     'id': f"legacy-{numero}",
                     'numero': numero,
                     'legacy': True,
-                    'pasta_relativa': os.path.relpath(pasta, self.pasta_backup)
+                    'pasta_relativa': os.path.relpath(pasta, self.server.pasta_backup)
                 }
             
-            dados = {
-                'numero': numero,
-                'metadata': metadata,
-                'arquivos': {}
-            }
-            
-            # Lê todos os arquivos (exceto metadata duplicada)
-            for arquivo in os.listdir(pasta):
-                if arquivo.lower() == 'metadata.json':
-                    continue
-                caminho = os.path.join(pasta, arquivo)
-                if not os.path.isfile(caminho):
-                    continue
-                with open(caminho, 'rb') as f:
-                    conteudo = f.read()
-                    dados['arquivos'][arquivo] = base64.b64encode(conteudo).decode('utf-8')
+            # Todos os arquivos (exceto metadata duplicada); o tamanho é
+            # fixado aqui, então um arquivo ainda em gravação vai até este ponto
+            arquivos = []
+            with os.scandir(pasta) as it:
+                for e in it:
+                    if e.name.lower() != 'metadata.json' and e.is_file():
+                        st = e.stat()
+                        arquivos.append((e.name, e.path, st.st_size, st.st_mtime_ns))
+            arquivos.sort()
             
-            return dados
+            return metadata, arquivos
         
         except Exception as e:
-            if self.logger:
-                self.logger.error(f"Erro ao obter dados do voo: {e}")
+            if self.server.logger:
+                self.server.logger.error(f"Erro ao obter dados do voo: {e}")
             return None
     
+    def _enviar_dados_voo(self, numero, metadata, arquivos):
+        """
+        Envia o voo como JSON com os arquivos em base64, em streaming
+        
+        O envelope é o mesmo de send_json ({'status', 'flight': {'numero',
+        'metadata', 'arquivos'}}), mas cada arquivo é lido e codificado em
+        blocos de BLOCO_BASE64 bytes direto no socket: memória constante e
+        primeiro byte sem esperar a codificação do voo inteiro.
+        
+        Respostas de até LIMITE_CACHE_VOO bytes ficam em cache (LRU de
+        VOOS_EM_CACHE voos) enquanto metadata e tamanho/mtime dos arquivos
+        não mudarem; downloads repetidos não releem nem recodificam nada.
+        """
+        metadata_json = _json_dumps(metadata)
+        assinatura = (metadata_json, tuple((a[0], a[2], a[3]) for a in arquivos))
+        with self._lock_cache_dados_voo:
+            item = self._cache_dados_voo.get(numero)
+            if item is not None and item[0] == assinatura:
+                self._cache_dados_voo.move_to_end(numero)
+            else:
+                item = None
+        if item is not None:
+            self._enviar_json_bytes(item[1])
+            return
+        
+        cabecalho = (
+            b'{"status":"ok","flight":{"numero":' + _json_dumps(numero) +
+            b',"metadata":' + metadata_json + b',"arquivos":{'
+        )
+        chaves = [
+            (b',' if i else b'') + _json_dumps(arquivo[0]) + b':"'
+            for i, arquivo in enumerate(arquivos)
+        ]
+        rodape = b'}}}'
+        
+        # Tamanho final conhecido de antemão: base64 ocupa 4 bytes a cada 3
+        total = len(cabecalho) + len(rodape) + sum(
+            len(chave) + 4 * ((arquivo[2] + 2) // 3) + 1
+            for chave, arquivo in zip(chaves, arquivos)
+        )
+        partes = [] if total <= LIMITE_CACHE_VOO else None
+        
+        # Com gzip o tamanho final não é conhecido: vai em chunks
+        comprimir = total > GZIP_MINIMO and self._aceita_gzip()
+        
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if comprimir:
+            self.send_header('Content-Encoding', 'gzip')
+            saida = self._saida_sem_tamanho()
+        else:
+            self.send_header('Content-Length', str(total))
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        
+        try:
+            if comprimir:
+                compressor = zlib.compressobj(1, zlib.DEFLATED, 31)  # 31: formato gzip
+            for parte in self._partes_dados_voo(cabecalho, chaves, arquivos, rodape):
+                if comprimir:
+                    saida.write(compressor.compress(parte))
+                else:
+                    self.wfile.write(parte)
+                if partes is not None:
+                    partes.append(parte)
+            if comprimir:
+                saida.write(compressor.flush())
+                saida.fechar()
+        except Exception as e:
+            # Cabeçalho já enviado: não há como responder com erro JSON
+            self.close_connection = True
+            if self.server.logger:
+                self.server.logger.error(f"Erro ao enviar voo {numero}: {e}")
+            return
+        
+        if partes is not None:
+            with self._lock_cache_dados_voo:
+                self._cache_dados_voo[numero] = (assinatura, b''.join(partes))
+                self._cache_dados_voo.move_to_end(numero)
+                while len(self._cache_dados_voo) > VOOS_EM_CACHE:
+                    self._cache_dados_voo.popitem(last=False)
+    
+    def _partes_dados_voo(self, cabecalho, chaves, arquivos, rodape):
+        """Gera a resposta de /flights/{numero} em pedaços (base64 por bloco)"""
+        yield cabecalho
+        for chave, (nome, caminho, tamanho, _mtime) in zip(chaves, arquivos):
+            yield chave
+            with open(caminho, 'rb') as f:
+                restante = tamanho
+                while restante > 0:
+                    bloco = f.read(min(BLOCO_BASE64, restante))
+                    if not bloco:
+                        raise IOError(f"{nome} encolheu durante o envio")
+                    restante -= len(bloco)
+                    yield _b64encode(bloco)
+            yield b'"'
+        yield rodape
+    
+    def _enviar_arquivo_voo(self, numero, nome):
+        """Envia um arquivo do voo como bytes (application/octet-stream)"""
+        dados = self._obter_dados_voo(numero)
+        if not dados:
+            self.send_json({'status': 'error', 'message': 'Voo não encontrado'}, 404)
+            return
+        
+        # Só nomes listados na pasta do voo (sem caminhos relativos)
+        encontrado = next((a for a in dados[1] if a[0] == nome), None)
+        if encontrado is None:
+            self.send_json({'status': 'error', 'message': 'Arquivo não encontrado'}, 404)
+            return
+        
+        _nome, caminho, tamanho, _mtime = encontrado
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(tamanho))
+        self.send_header('Content-Disposition', f'attachment; filename="{nome}"')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        
+        try:
+            # Cabeçalhos precisam sair antes do corpo, que vai direto no socket
+            self.wfile.flush()
+            with open(caminho, 'rb') as f:
+                # socket.sendfile usa os.sendfile (cópia arquivo→socket no kernel)
+                # e cai para read/send sozinho onde não houver suporte
+                enviado = self.connection.sendfile(f, 0, tamanho)
+            if enviado < tamanho:
+                raise IOError(f"{nome} encolheu durante o envio")
+        except Exception as e:
+            self.close_connection = True
+            if self.server.logger:
+                self.server.logger.error(f"Erro ao enviar arquivo {nome} do voo {numero}: {e}")
+    
+    def _enviar_tar_voo(self, numero):
+        """
+        Envia metadata e arquivos do voo como tar (application/x-tar)
+        
+        O tar é gerado enquanto é enviado (Transfer-Encoding: chunked, ou
+        corpo até o fim da conexão em HTTP/1.0), sem base64 e sem montar o
+        voo inteiro em memória.
+        """
+        dados = self._obter_dados_voo(numero)
+        if not dados:
+            self.send_json({'status': 'error', 'message': 'Voo não encontrado'}, 404)
+            return
+        metadata, arquivos = dados
+        
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-tar')
+        saida = self._saida_sem_tamanho()
+        self.send_header('Content-Disposition', f'attachment; filename="voo_{numero}.tar"')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        
+        try:
+            with tarfile.open(fileobj=saida, mode='w|') as tar:
+                meta = _json_dumps(metadata)
+                info = tarfile.TarInfo('metadata.json')
+                info.size = len(meta)
+                info.mtime = time.time()
+                tar.addfile(info, io.BytesIO(meta))
+                
+                for nome, caminho, tamanho, mtime_ns in arquivos:
+                    # Tamanho fixado na listagem: arquivo ainda em gravação
+                    # entra até esse ponto
+                    info = tarfile.TarInfo(nome)
+                    info.size = tamanho
+                    info.mtime = mtime_ns // 1_000_000_000
+                    with open(caminho, 'rb') as f:
+                        tar.addfile(info, f)
+            saida.fechar()
+        except Exception as e:
+            self.close_connection = True
+            if self.server.logger:
+                self.server.logger.error(f"Erro ao enviar tar do voo {numero}: {e}")
+    
     def _apagar_voo(self, numero):
         """Apaga um voo da Raspberry"""
         try:
@@ -493,33 +931,248 @@ class CotesiaHTTPHandler(BaseHTTPRequestHandler):
                 return False
             
             shutil.rmtree(pasta)
+            with self._lock_cache_dados_voo:
+                self._cache_dados_voo.pop(numero, None)
+            # A lista não pode continuar mostrando o voo até o próximo ciclo
+            self.server.reconstruir_indice_voos()
             
-            if self.logger:
-                self.logger.info(f"Voo {numero} apagado")
+            if self.server.logger:
+                self.server.logger.info(f"Voo {numero} apagado")
             
             return True
         
         except Exception as e:
-            if self.logger:
-                self.logger.error(f"Erro ao apagar voo: {e}")
+            if self.server.logger:
+                self.server.logger.error(f"Erro ao apagar voo: {e}")
             return False
 
     def _iterar_voos_metadata(self):
-        """Itera sobre todos os arquivos de metadata da estrutura nova"""
-        pattern = os.path.join(self.pasta_backup, "**", "metadata.json")
-        arquivos_meta = glob.glob(pattern, recursive=True)
-        for meta_file in arquivos_meta:
+        """
+        Itera sobre todos os arquivos de metadata da estrutura nova
+        
+        Cada metadata.json só é relido quando mtime/tamanho muda; os dicts
+        vêm compartilhados do cache da classe e não devem ser alterados.
+        """
+        cache = self._cache_metadata
+        vistos = set()
+        for entrada in _procurar_metadata(self.server.pasta_backup):
+            meta_file = entrada.path
             try:
-                with open(meta_file, 'r', encoding='utf-8') as f:
-                    dados = json.load(f)
-                dados['_path'] = os.path.dirname(meta_file)
-                yield dados
-            except Exception as e:
-                if self.logger:
-                    self.logger.warning(f"Falha ao ler metadata {meta_file}: {e}")
+                st = entrada.stat()
+            except OSError:
+                continue
+            assinatura = (st.st_mtime_ns, st.st_size)
+            vistos.add(meta_file)
+            item = cache.get(meta_file)
+            if item is None or item[0] != assinatura:
+                # Entra no cache já: a busca por número para no primeiro
+                # voo encontrado e não chega ao fim da varredura
+                item = (assinatura, _ler_metadata(meta_file, self.server.logger))
+                with self._lock_cache_metadata:
+                    cache[meta_file] = item
+            if item[1] is not None:
+                yield item[1]
+        
+        # Só com a varredura completa dá para descartar voos apagados
+        with self._lock_cache_metadata:
+            for meta_file in cache.keys() - vistos:
+                del cache[meta_file]
 
+    def _buscar_voo_por_numero(self, numero):
+        """Localiza pasta e metadata de um voo pelo número global"""
+        try:
+            for meta in self._iterar_voos_metadata():
+                meta_num = meta.get('numero_global') or meta.get('numero')
+                if meta_num and int(meta_num) == int(numero):
+                    caminho = meta['_path']
+                    meta_copia = {k: v for k, v in meta.items() if k != '_path'}
+                    return caminho, meta_copia
+        except Exception as e:
+            if self.server.logger:
+                self.server.logger.error(f"Erro ao buscar metadata do voo {numero}: {e}")
+
+        # Fallback para estrutura antiga
+        pasta_legado = os.path.join(self.server.pasta_backup, f"VOO_{numero}")
+        if os.path.exists(pasta_legado):
+            return pasta_legado, None
+        return None, None
+
+    # Rotas exatas (path em minúsculas, sem '/' final) -> handler;
+    # /flights/{numero} e afins seguem tratados por prefixo
+    _ROTAS_GET = {
+        '/ping': _get_ping,
+        '/status': _get_status,
+        '/config': _get_config,
+        '/gps/settings': _get_gps_settings,
+        '/servo/calibration': _get_servo_calibration,
+        '/servo/calibration/measure': _get_servo_calibration_measure,
+        '/flights/list': _get_flights_list,
+        '/': _get_raiz,
+    }
+    _ROTAS_POST = {
+        '/servo/test': _post_servo_test,
+        '/servo/reset': _post_servo_reset,
+        '/servo/angle': _post_servo_angle,
+        '/servo/calibration': _post_servo_calibration,
+        '/servo/calibration/detect': _post_servo_calibration_detect,
+        '/servo/calibration/measure': _post_servo_calibration_measure,
+        '/gps/frequency': _post_gps_frequency,
+        '/system/boot': _post_system_boot,
+        '/system/reset': _post_system_reset,
+        '/flight/start': _post_flight_start,
+        '/flight/stop': _post_flight_stop,
+        '/flight/simulate': _post_flight_simulate,
+        '/flight/simulate/stop': _post_flight_simulate_stop,
+        '/config': _post_config,
+    }
+
+
+# Métodos que podem faltar em versões antigas de ServoControl/GPSControl
+# (o endpoint correspondente usa uma alternativa ou responde 501)
+RECURSOS_OPCIONAIS = (
+    ('servo_control', 'get_calibration'),
+    ('servo_control', 'set_calibration'),
+    ('servo_control', 'medir_calibracao'),
+    ('servo_control', 'detectar_limites'),
+    ('gps_control', 'get_gps_settings'),
+    ('gps_control', 'set_gps_frequency'),
+    ('gps_control', 'iniciar_simulacao'),
+    ('gps_control', 'parar_simulacao'),
+)
+
+
+class CotesiaServer(ThreadingHTTPServer):
+    """
+    Servidor HTTP com uma thread por conexão (no máximo MAX_CONEXOES)
+    
+    Guarda as dependências compartilhadas pelos handlers (acessadas como
+    self.server.* dentro do CotesiaHTTPHandler) e o índice de voos de
+    /flights/list, reconstruído numa thread a cada INTERVALO_INDICE_VOOS
+    segundos: a requisição só escreve os bytes já serializados.
+    """
+    
+    # /status e /ping não esperam atrás de um download longo de /flights/{n}
+    daemon_threads = True
+    allow_reuse_address = True
+    
+    def __init__(self, endereco, servo_control, gps_control, logger, pasta_backup):
+        self.servo_control = servo_control
+        self.gps_control = gps_control
+        self.logger = logger
+        self.pasta_backup = pasta_backup
+        self._vagas = threading.BoundedSemaphore(MAX_CONEXOES)
+        # Métodos opcionais verificados uma vez aqui, não a cada requisição
+        self.recursos = frozenset(
+            metodo for dependencia, metodo in RECURSOS_OPCIONAIS
+            if hasattr(getattr(self, dependencia), metodo)
+        )
+        super().__init__(endereco, CotesiaHTTPHandler)
+        
+        # Índice de voos: caminho -> (assinatura de mtime/tamanho, info do
+        # voo) entre reconstruções; indice_voos é trocado de uma vez (bytes)
+        self._cache_voos = {}
+        self._lock_indice = threading.Lock()
+        self._parar_indice = threading.Event()
+        self.reconstruir_indice_voos()
+        threading.Thread(target=self._thread_indice_voos, daemon=True).start()
+    
+    def process_request(self, request, client_address):
+        # Com todas as vagas ocupadas responde 503 na própria thread do
+        # serve_forever, sem esperar: esperar aqui travaria novas conexões e
+        # o shutdown() enquanto clientes keep-alive seguram as vagas
+        if not self._vagas.acquire(blocking=False):
+            self._recusar_conexao(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self._vagas.release()
+            raise
+    
+    def _recusar_conexao(self, request):
+        """Responde 503 (Connection: close) sem ler a requisição e fecha"""
+        try:
+            request.settimeout(1)
+            request.sendall(_RESPOSTA_OCUPADO)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+    
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._vagas.release()
+    
+    def server_close(self):
+        self._parar_indice.set()
+        super().server_close()
+    
+    def reconstruir_indice_voos(self):
+        """Relista os voos e publica a resposta de /flights/list"""
+        with self._lock_indice:
+            voos = self._listar_voos()
+            self.indice_voos = _json_dumps({'status': 'ok', 'flights': voos})
+    
+    def _thread_indice_voos(self):
+        """Reconstrói o índice periodicamente (voos novos/alterados pelo GPS)"""
+        while not self._parar_indice.wait(INTERVALO_INDICE_VOOS):
+            self.reconstruir_indice_voos()
+    
+    def _listar_voos(self):
+        """
+        Lista todos os voos salvos
+        
+        Metadata e DADOS só são relidos quando o mtime/tamanho muda; voos
+        sem mudança vêm de _cache_voos.
+        """
+        voos = []
+        vistos = {}
+        try:
+            # Estrutura nova (com metadata)
+            for entrada in _procurar_metadata(self.pasta_backup):
+                meta_file = entrada.path
+                try:
+                    st = entrada.stat()
+                except OSError:
+                    continue
+                info = self._info_em_cache(
+                    meta_file, (st.st_mtime_ns, st.st_size), vistos,
+                    lambda: self._montar_info_voo_meta(_ler_metadata(meta_file, self.logger))
+                )
+                if info is not None:
+                    voos.append(info)
+            
+            # Compatibilidade com estrutura antiga
+            voos.extend(self._listar_voos_legado(vistos))
+            
+            self._cache_voos = vistos
+            
+            voos.sort(
+                key=lambda v: (
+                    v.get('data_iso') or '',
+                    v.get('numero') or 0
+                ),
+                reverse=True
+            )
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Erro ao listar voos: {e}", exc_info=True)
+        
+        return voos
+    
+    def _info_em_cache(self, chave, assinatura, vistos, montar):
+        """Info do voo em cache se a assinatura não mudou; senão monta de novo"""
+        item = self._cache_voos.get(chave)
+        if item is None or item[0] != assinatura:
+            item = (assinatura, montar())
+        vistos[chave] = item
+        return item[1]
+    
     def _montar_info_voo_meta(self, meta):
         """Monta dicionário de informações a partir da metadata do voo"""
+        if meta is None:
+            return None
         info = {
             'id': meta.get('id'),
             'numero': meta.get('numero_global') or meta.get('numero'),
@@ -537,86 +1190,95 @@ class CotesiaHTTPHandler(BaseHTTPRequestHandler):
             'arquivos': meta.get('arquivos', {}),
         }
         return info
-
-    def _listar_voos_legado(self):
+    
+    def _listar_voos_legado(self, vistos):
         """Compatibilidade com estrutura antiga (sem metadata)"""
         voos = []
-        pastas_voos = glob.glob(os.path.join(self.pasta_backup, "VOO_*"))
-        for pasta in sorted(pastas_voos):
-            if not os.path.isdir(pasta):
-                continue
+        # Uma leitura do diretório; número e tipo saem do próprio DirEntry
+        with os.scandir(self.pasta_backup) as it:
+            pastas_voos = [
+                (int(e.name[4:]), e.path, e.stat().st_mtime_ns)
+                for e in it
+                if e.name.startswith('VOO_') and e.name[4:].isdigit() and e.is_dir()
+            ]
+        pastas_voos.sort()
+        for numero, pasta, mtime_pasta in pastas_voos:
+            # Pasta (arquivos criados/removidos) + DADOS (conteúdo)
             try:
-                numero = int(os.path.basename(pasta).split('_')[-1])
-            except ValueError:
-                continue
+                st_dados = os.stat(os.path.join(pasta, f"DADOS{numero:02d}.txt"))
+                assinatura_dados = (st_dados.st_mtime_ns, st_dados.st_size)
+            except OSError:
+                assinatura_dados = None
+            assinatura = (mtime_pasta, assinatura_dados)
+            voos.append(self._info_em_cache(
+                pasta, assinatura, vistos,
+                lambda: self._montar_info_voo_legado(pasta, numero)
+            ))
+        return voos
+    
+    def _montar_info_voo_legado(self, pasta, numero):
+        """Monta informações de um voo da estrutura antiga (lê DADOS*.txt)"""
+        info = {
+            'id': f"legacy-{numero}",
+            'numero': numero,
+            'data': 'N/A',
+            'data_humana': 'N/A',
+            'data_iso': '',
+            'tubos': 0,
+            'duracao': 'N/A',
+            'tamanho_mb': 0,
+            'pasta_relativa': os.path.relpath(pasta, self.pasta_backup),
+            'legacy': True,
+        }
 
-            info = {
-                'id': f"legacy-{numero}",
-                'numero': numero,
-                'data': 'N/A',
-                'data_humana': 'N/A',
-                'data_iso': '',
-                'tubos': 0,
-                'duracao': 'N/A',
-                'tamanho_mb': 0,
-                'pasta_relativa': os.path.relpath(pasta, self.pasta_backup),
-                'legacy': True,
-            }
-
-            # Calcula tamanho total
-            tamanho_total = 0
-            for arquivo in os.listdir(pasta):
-                caminho = os.path.join(pasta, arquivo)
-                if os.path.isfile(caminho):
-                    tamanho_total += os.path.getsize(caminho)
-            info['tamanho_mb'] = round(tamanho_total / 1024 / 1024, 2)
-
-            arquivo_dados = os.path.join(pasta, f"DADOS{numero:02d}.txt")
-            if os.path.exists(arquivo_dados):
-                try:
-                    with open(arquivo_dados, 'r', encoding='utf-8') as f:
-                        conteudo = f.read()
-                        for linha in conteudo.split('\n'):
-                            if 'Data:' in linha:
-                                info['data'] = linha.split('Data:')[1].strip()
-                            elif 'Tubos lançados:' in linha:
-                                info['tubos'] = int(linha.split(':')[1].strip())
-                            elif 'Duração:' in linha:
-                                info['duracao'] = linha.split('Duração:')[1].strip()
-                except Exception:
-                    pass
-
-            info['data_humana'] = info['data']
+        # Uma passada na pasta: soma o tamanho total e localiza o DADOS
+        nome_dados = f"DADOS{numero:02d}.txt"
+        arquivo_dados = None
+        tamanho_total = 0
+        with os.scandir(pasta) as it:
+            for e in it:
+                if not e.is_file(follow_symlinks=False):
+                    continue
+                tamanho_total += e.stat(follow_symlinks=False).st_size
+                if e.name == nome_dados:
+                    arquivo_dados = e.path
+        info['tamanho_mb'] = round(tamanho_total / 1024 / 1024, 2)
+
+        if arquivo_dados is not None:
             try:
-                parsed = datetime.strptime(info['data'], '%d/%m/%Y %H:%M:%S')
-                info['data_iso'] = parsed.isoformat()
-                info.setdefault('ano', parsed.year)
-                info.setdefault('mes', parsed.month)
-                info.setdefault('dia', parsed.day)
+                # Os três campos ficam no topo do relatório: lê linha a linha
+                # e para assim que todos foram encontrados
+                encontrados = set()
+                with open(arquivo_dados, 'r', encoding='utf-8') as f:
+                    for linha in f:
+                        # 'Chave: valor' -> partition no primeiro ':' (sem lista)
+                        chave, _, valor = linha.partition(':')
+                        chave = chave.strip()
+                        if chave == 'Data':
+                            info['data'] = valor.strip()
+                        elif chave == 'Tubos lançados':
+                            info['tubos'] = int(valor)
+                        elif chave == 'Duração':
+                            info['duracao'] = valor.strip()
+                        else:
+                            continue
+                        encontrados.add(chave)
+                        if len(encontrados) == 3:
+                            break
             except Exception:
-                info['data_iso'] = ''
+                pass
 
-            voos.append(info)
-        return voos
-
-    def _buscar_voo_por_numero(self, numero):
-        """Localiza pasta e metadata de um voo pelo número global"""
+        info['data_humana'] = info['data']
         try:
-            for meta in self._iterar_voos_metadata():
-                meta_num = meta.get('numero_global') or meta.get('numero')
-                if meta_num and int(meta_num) == int(numero):
-                    caminho = meta['_path']
-                    meta_copia = {k: v for k, v in meta.items() if k != '_path'}
-                    return caminho, meta_copia
-        except Exception as e:
-            if self.logger:
-                self.logger.error(f"Erro ao buscar metadata do voo {numero}: {e}")
+            parsed = datetime.strptime(info['data'], '%d/%m/%Y %H:%M:%S')
+            info['data_iso'] = parsed.isoformat()
+            info.setdefault('ano', parsed.year)
+            info.setdefault('mes', parsed.month)
+            info.setdefault('dia', parsed.day)
+        except Exception:
+            info['data_iso'] = ''
 
-        # Fallback para estrutura antiga
-        pasta_legado = os.path.join(self.pasta_backup, f"VOO_{numero}")
-        if os.path.exists(pasta_legado):
-            return pasta_legado, None
-        return None, None
+        return info
 
 
 def main():
@@ -649,31 +1311,16 @@ def main():
             servo_control.inicializar_gpio()
     
     # Inicializa controle de GPS
-    config = {
-        'distancia_metros': 25,
-        'tempo_parada': 10,
-        'velocidade_operacao': 5.0,
-        'precisao_minima_satelites': 3,
-        'pdop_maximo': 6.0,
-        'first_movement_threshold': 5.0,
-        'velocidade_parada': 1.5
-    }
-    gps_control = GPSControl(servo_control, logger=logger, config=config)
+    gps_control = GPSControl(servo_control, logger=logger, config=CONFIG_GPS)
     
     # Inicia GPS
     gps_control.iniciar()
     
-    # Configura handler
-    CotesiaHTTPHandler.servo_control = servo_control
-    CotesiaHTTPHandler.gps_control = gps_control
-    CotesiaHTTPHandler.logger = logger
-    CotesiaHTTPHandler.pasta_backup = pasta_backup
-    
     # Inicia servidor HTTP
     host = '0.0.0.0'  # Escuta em todas as interfaces
     port = 8080
     
-    server = HTTPServer((host, port), CotesiaHTTPHandler)
+    server = CotesiaServer((host, port), servo_control, gps_control, logger, pasta_backup)
     
     logger.info(f"Servidor HTTP rodando em {host}:{port}")
     logger.info("API REST disponível para controle remoto via WiFi")
@@ -681,10 +1328,10 @@ def main():
     # Handler de sinais
     def signal_handler(signum, frame):
         logger.info("Encerrando servidor...")
-        gps_control.parar()
-        servo_control.limpar()
-        server.shutdown()
-        sys.exit(0)
+        # O sinal chega na thread de serve_forever(): shutdown() espera o
+        # laço terminar, então precisa ser chamado de outra thread. GPS e
+        # servos são liberados no finally abaixo
+        threading.Thread(target=server.shutdown, daemon=True).start()
     
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
@@ -694,6 +1341,7 @@ def main():
     except KeyboardInterrupt:
         logger.info("Servidor interrompido")
     finally:
+        server.server_close()
         gps_control.parar()
         servo_control.limpar()
 
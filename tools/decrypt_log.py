@@ -3,19 +3,65 @@
 """
 Script utilitário para descriptografar logs de voo gerados pelo Sistema Cotesia.
 
+Formatos aceitos:
+    - AES-256-GCM: CTSGCM01 || nonce (12) || tag (16) || ciphertext,
+      com chave = SHA-256 do conteúdo do arquivo de chave
+    - Fernet em blocos: [tamanho 4 bytes big-endian][token]...
+    - Fernet antigo: um único token para o arquivo inteiro
+
 Uso:
     python decrypt_log.py path/do/log.enc path/da/chave.key output.txt
 """
 
+import hashlib
 import sys
 from pathlib import Path
 
 try:
+    from cryptography.exceptions import InvalidTag
     from cryptography.fernet import Fernet
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 except ImportError:
     print("❌ Biblioteca 'cryptography' não encontrada. Instale com: pip install cryptography")
     sys.exit(1)
 
+CABECALHO_LOG_AESGCM = b"CTSGCM01"
+BLOCO = 1 << 20
+
+# Todo token Fernet começa com o byte de versão 0x80 ("gAAAAA" em base64)
+PREFIXO_TOKEN_FERNET = b"gAAAAA"
+
+
+def descriptografar_aesgcm(key, origem, saida):
+    """Descriptografa o formato AES-256-GCM (origem já posicionada após o cabeçalho)"""
+    nonce = origem.read(12)
+    tag = origem.read(16)
+    if len(nonce) < 12 or len(tag) < 16:
+        raise ValueError("Cabeçalho AES-GCM truncado")
+    chave = hashlib.sha256(key).digest()
+    decryptor = Cipher(algorithms.AES(chave), modes.GCM(nonce, tag)).decryptor()
+    while True:
+        bloco = origem.read(BLOCO)
+        if not bloco:
+            break
+        saida.write(decryptor.update(bloco))
+    decryptor.finalize()
+
+
+def descriptografar_blocos(fernet, origem, saida):
+    """Descriptografa os blocos [tamanho][token] de origem gravando em saida"""
+    while True:
+        cabecalho = origem.read(4)
+        if not cabecalho:
+            break
+        if len(cabecalho) < 4:
+            raise ValueError("Bloco truncado no arquivo criptografado")
+        tamanho = int.from_bytes(cabecalho, 'big')
+        token = origem.read(tamanho)
+        if len(token) < tamanho:
+            raise ValueError("Bloco truncado no arquivo criptografado")
+        saida.write(fernet.decrypt(token))
+
 
 def main():
     if len(sys.argv) != 4:
@@ -35,16 +81,26 @@ def main():
         sys.exit(1)
 
     key = arquivo_chave.read_bytes().strip()
-    fernet = Fernet(key)
 
-    dados = arquivo_log.read_bytes()
-    conteudo = fernet.decrypt(dados)
-    destino.write_bytes(conteudo)
+    try:
+        with open(arquivo_log, 'rb') as origem, open(destino, 'wb') as saida:
+            inicio = origem.read(len(CABECALHO_LOG_AESGCM))
+            if inicio == CABECALHO_LOG_AESGCM:
+                descriptografar_aesgcm(key, origem, saida)
+            elif inicio.startswith(PREFIXO_TOKEN_FERNET):
+                # Formato antigo: arquivo inteiro em um único token
+                origem.seek(0)
+                saida.write(Fernet(key).decrypt(origem.read()))
+            else:
+                origem.seek(0)
+                descriptografar_blocos(Fernet(key), origem, saida)
+    except InvalidTag:
+        destino.unlink(missing_ok=True)
+        print("❌ Falha de autenticação: chave incorreta ou log corrompido")
+        sys.exit(1)
 
     print(f"✅ Log descriptografado com sucesso em: {destino}")
 
 
 if __name__ == "__main__":
     main()
-
-